@@ -0,0 +1,8 @@
+from blog.services import flush_views
+
+
+def flush_blog_views():
+    """
+    Периодическая запись накопленных просмотров статей в БД
+    """
+    flush_views()
@@ -0,0 +1,39 @@
+from django.core.cache import cache
+from django.db.models import Case, F, Value, When
+
+from blog.models import Blog
+from config.settings import BLOG_VIEWS_BUFFERED
+
+VIEWS_KEY = "blog_views_{}"
+
+
+def count_view(blog_pk):
+    """
+    Учет просмотра статьи: счетчик в кеше (в БД записывается flush_views),
+    без общего кеша - атомарное увеличение в БД
+    """
+    if not BLOG_VIEWS_BUFFERED:
+        Blog.objects.filter(pk=blog_pk).update(views_count=F("views_count") + 1)
+        return
+    key = VIEWS_KEY.format(blog_pk)
+    cache.add(key, 0, timeout=None)
+    cache.incr(key)
+
+
+def flush_views():
+    """
+    Запись накопленных в кеше просмотров в БД одним UPDATE
+    """
+    keys = {VIEWS_KEY.format(pk): pk for pk in Blog.objects.values_list("pk", flat=True)}
+    views = {}
+    for key, count in cache.get_many(keys).items():
+        if count:
+            # вычитаем записанное, просмотры за время записи останутся в кеше
+            cache.decr(key, count)
+            views[keys[key]] = count
+    if views:
+        Blog.objects.filter(pk__in=views).update(
+            views_count=F("views_count")
+            + Case(*(When(pk=pk, then=Value(count)) for pk, count in views.items()), default=0)
+        )
+    return views
@@ -1,3 +1,53 @@
+from unittest import mock
+
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from blog.models import Blog
+from blog.services import VIEWS_KEY, count_view, flush_views
+
+
+@mock.patch("blog.services.BLOG_VIEWS_BUFFERED", True)
+class FlushViewsTest(TestCase):
+    """
+    Просмотры статей копятся в кеше и записываются в БД одним UPDATE
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.first = Blog.objects.create(title="Первая", views_count=10)
+        cls.second = Blog.objects.create(title="Вторая")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_views_buffered_in_cache(self):
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                count_view(self.first.pk)
+        self.assertEqual(cache.get(VIEWS_KEY.format(self.first.pk)), 3)
+
+    def test_flush(self):
+        for _ in range(3):
+            count_view(self.first.pk)
+        count_view(self.second.pk)
+        with self.assertNumQueries(2):
+            # список статей и один UPDATE
+            self.assertEqual(flush_views(), {self.first.pk: 3, self.second.pk: 1})
+        self.assertEqual(
+            dict(Blog.objects.values_list("pk", "views_count")),
+            {self.first.pk: 13, self.second.pk: 1},
+        )
+        # записанные просмотры вычтены из кеша: повторная запись ничего не меняет
+        self.assertEqual(flush_views(), {})
+        count_view(self.first.pk)
+        self.assertEqual(flush_views(), {self.first.pk: 1})
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.views_count, 14)
+
+    def test_without_cache_updates_db(self):
+        with mock.patch("blog.services.BLOG_VIEWS_BUFFERED", False):
+            count_view(self.second.pk)
+        self.second.refresh_from_db()
+        self.assertEqual(self.second.views_count, 1)
+        self.assertEqual(flush_views(), {})
@@ -1,15 +1,24 @@
-from django.shortcuts import render
+from functools import wraps
+
 from django.views.generic import DetailView
 
 from blog.models import Blog
+from blog.services import count_view
 
 
 class BlogDetailView(DetailView):
     model = Blog
     # extra_context = {'title': 'Интересно...'}
 
-    def get_object(self, queryset=None):
-        self.object = super().get_object(queryset)
-        self.object.views_count += 1
-        self.object.save()
-        return self.object
+
+def count_blog_view(view):
+    """
+    Учет просмотра статьи, в том числе когда страница отдается из кеша
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200:
+            count_view(kwargs["pk"])
+        return response
+    return wrapper
@@ -50,6 +50,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # замер SQL-запросов, кеша и времени обработки (заголовок Server-Timing)
+    'email_newsletter.middleware.RequestMetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -91,7 +93,9 @@ DATABASES = {
         'HOST': os.getenv('HOST'),
         'PORT': os.getenv('PORT'),
         'PASSWORD': os.getenv('PASSWORD'),
-
+        # время жизни соединения, сек: планировщик run_scheduler держит соединения открытыми
+        'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
@@ -155,6 +159,29 @@ EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
 EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', False) == 'True'
 EMAIL_USE_SSL = os.getenv('EMAIL_USE_SSL', False) == 'True'
+# количество писем, отправляемых через одно SMTP-соединение без возврата в пул
+EMAIL_BATCH_SIZE = int(os.getenv('EMAIL_BATCH_SIZE', 100))
+# количество открытых SMTP-соединений, которые держит пул
+EMAIL_POOL_SIZE = int(os.getenv('EMAIL_POOL_SIZE', 2))
+# через сколько секунд простоя соединение из пула закрывается
+EMAIL_POOL_IDLE_TIMEOUT = int(os.getenv('EMAIL_POOL_IDLE_TIMEOUT', 60))
+# отправка писем рассылок: "sync" - последовательно через пул соединений,
+# "async" - asyncio, EMAIL_ASYNC_CONCURRENCY одновременных SMTP-сессий (нужен пакет aiosmtplib)
+EMAIL_DELIVERY_MODE = os.getenv('EMAIL_DELIVERY_MODE', 'sync')
+EMAIL_ASYNC_CONCURRENCY = int(os.getenv('EMAIL_ASYNC_CONCURRENCY', 10))
+
+# ограничение скорости отправки, писем в секунду (0 - без ограничения; в пределах процесса):
+# общее, на почтовый ящик отправителя, на домен получателя
+EMAIL_RATE_LIMIT = float(os.getenv('EMAIL_RATE_LIMIT', 0))
+EMAIL_SENDER_RATE_LIMIT = float(os.getenv('EMAIL_SENDER_RATE_LIMIT', 0))
+EMAIL_DOMAIN_RATE_LIMIT = float(os.getenv('EMAIL_DOMAIN_RATE_LIMIT', 0))
+# отдельные лимиты доменов в виде "gmail.com=5,mail.ru=10"
+EMAIL_DOMAIN_RATE_LIMITS = {
+    domain.strip().lower(): float(rate)
+    for domain, _, rate in (
+        item.partition('=') for item in os.getenv('EMAIL_DOMAIN_RATE_LIMITS', '').split(',') if item
+    )
+}
 
 SUPERUSER_PASSWORD = os.getenv("SUPERUSER_PASSWORD")
 
@@ -166,14 +193,72 @@ LOGIN_URL = '/users/'
 
 
 CRONJOBS = [
-    ('*/5 * * * *', 'email_newsletter.cron.my_scheduled_job')
+    ('*/5 * * * *', 'email_newsletter.cron.my_scheduled_job'),
+    ('*/5 * * * *', 'blog.cron.flush_blog_views'),
+    ('* * * * *', 'email_newsletter.outbox.drain_outbox'),
 ]
+# параллельная обработка рассылок: "thread" - пул потоков, "process" - пул процессов
+NEWSLETTER_DISPATCH_MODE = os.getenv('NEWSLETTER_DISPATCH_MODE', 'thread')
+# количество рассылок, обрабатываемых одновременно (1 - по очереди)
+NEWSLETTER_WORKERS = int(os.getenv('NEWSLETTER_WORKERS', 4))
+# очередь служебных писем: размер пачки, количество попыток,
+# задержка перед повтором (удваивается с каждой попыткой) и ее максимум, сек
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 100))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 5))
+OUTBOX_RETRY_DELAY = int(os.getenv('OUTBOX_RETRY_DELAY', 60))
+OUTBOX_MAX_RETRY_DELAY = int(os.getenv('OUTBOX_MAX_RETRY_DELAY', 3600))
+# на сколько секунд выбранные для отправки письма скрываются от других запусков
+OUTBOX_LEASE = int(os.getenv('OUTBOX_LEASE', 600))
+# повторная отправка клиентам после временной ошибки: количество попыток,
+# задержка перед повтором (удваивается с каждой попыткой) и ее максимум, сек
+NEWSLETTER_RETRY_MAX_ATTEMPTS = int(os.getenv('NEWSLETTER_RETRY_MAX_ATTEMPTS', 5))
+NEWSLETTER_RETRY_DELAY = int(os.getenv('NEWSLETTER_RETRY_DELAY', 300))
+NEWSLETTER_RETRY_MAX_DELAY = int(os.getenv('NEWSLETTER_RETRY_MAX_DELAY', 6 * 3600))
+NEWSLETTER_RETRY_BATCH_SIZE = int(os.getenv('NEWSLETTER_RETRY_BATCH_SIZE', 1000))
+NEWSLETTER_RETRY_LEASE = int(os.getenv('NEWSLETTER_RETRY_LEASE', 600))
+# рассылки захватываются планировщиком на NEWSLETTER_LEASE сек, не более
+# NEWSLETTER_CLAIM_BATCH_SIZE за проход - несколько планировщиков делят работу
+NEWSLETTER_LEASE = int(os.getenv('NEWSLETTER_LEASE', 3600))
+NEWSLETTER_CLAIM_BATCH_SIZE = int(os.getenv('NEWSLETTER_CLAIM_BATCH_SIZE', 100))
+# только один планировщик (advisory-блокировка); False - можно запустить несколько
+SCHEDULER_SINGLE_INSTANCE = os.getenv('SCHEDULER_SINGLE_INSTANCE', 'True') == 'True'
+# наибольшая пауза планировщика run_scheduler между проверками новых рассылок, сек
+SCHEDULER_MAX_SLEEP = int(os.getenv('SCHEDULER_MAX_SLEEP', 30))
+# количество получателей рассылки, читаемых из БД за один раз
+RECIPIENT_CHUNK_SIZE = int(os.getenv('RECIPIENT_CHUNK_SIZE', 2000))
+# количество клиентов, создаваемых при загрузке из файла одним INSERT
+CLIENT_IMPORT_BATCH_SIZE = int(os.getenv('CLIENT_IMPORT_BATCH_SIZE', 5000))
+# количество строк отчета, читаемых из БД за один раз при выгрузке
+REPORT_EXPORT_CHUNK_SIZE = int(os.getenv('REPORT_EXPORT_CHUNK_SIZE', 2000))
+# количество результатов отправки клиентам, записываемых в БД одним INSERT
+DELIVERY_LOG_BATCH_SIZE = int(os.getenv('DELIVERY_LOG_BATCH_SIZE', 1000))
 
 CACHE_ENABLED = os.getenv('CACHE_ENABLED', False) == 'True'
-if CACHE_ENABLED:
+# бэкенды кеша с подсчетом попаданий и промахов для метрик запросов
+if CACHE_ENABLED and os.getenv('LOCATION'):
     CACHES = {
         'default': {
-            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'BACKEND': 'email_newsletter.instrumentation.InstrumentedRedisCache',
             'LOCATION': os.getenv('LOCATION'),
         }
     }
+else:
+    # Redis не настроен - кеш в памяти процесса
+    CACHES = {
+        'default': {
+            'BACKEND': 'email_newsletter.instrumentation.InstrumentedLocMemCache',
+        }
+    }
+# просмотры статей копятся в общем кеше (Redis) и записываются в БД по расписанию
+BLOG_VIEWS_BUFFERED = CACHE_ENABLED and bool(os.getenv('LOCATION'))
+# время хранения списка статей в кеше, сек
+BLOG_CACHE_TIMEOUT = int(os.getenv('BLOG_CACHE_TIMEOUT', 300))
+# время хранения счетчиков главной страницы в кеше, сек
+HOMEPAGE_STATS_TIMEOUT = int(os.getenv('HOMEPAGE_STATS_TIMEOUT', 60))
+# метрики запросов: статистика по маршрутам (request_stats/) и заголовок Server-Timing
+# (только для персонала; при DEBUG - для всех) - включается на тестовом стенде
+INSTRUMENTATION_ENABLED = os.getenv('INSTRUMENTATION_ENABLED', False) == 'True'
+# поиск повторяющихся SQL-запросов (N+1) - включается на тестовом стенде
+INSTRUMENTATION_DUPLICATE_QUERIES = os.getenv('INSTRUMENTATION_DUPLICATE_QUERIES', False) == 'True'
+# сколько раз должен повториться SQL-запрос за один запрос страницы, чтобы попасть в лог
+INSTRUMENTATION_DUPLICATE_THRESHOLD = int(os.getenv('INSTRUMENTATION_DUPLICATE_THRESHOLD', 5))
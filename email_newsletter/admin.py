@@ -1,6 +1,16 @@
 from django.contrib import admin
 
-from email_newsletter.models import Client, Message, Newsletter, Attempt
+from email_newsletter.models import (
+    Client,
+    Message,
+    Newsletter,
+    Attempt,
+    Delivery,
+    DeliveryRetry,
+    DeliveryStat,
+    OutgoingEmail,
+    Suppression,
+)
 
 
 @admin.register(Client)
@@ -15,7 +25,7 @@ class MessageAdmin(admin.ModelAdmin):
 
 @admin.register(Newsletter)
 class NewsletterAdmin(admin.ModelAdmin):
-    list_display = ('id', 'start_data', 'end_data', 'periodicity', 'status', 'message',)
+    list_display = ('id', 'start_data', 'end_data', 'periodicity', 'status', 'message', 'locked_by',)
     list_filter = ('client', 'message', 'status', 'periodicity',)
     # search_fields = ('product_name', 'description',)
 
@@ -24,3 +34,40 @@ class NewsletterAdmin(admin.ModelAdmin):
 class AttemptAdmin(admin.ModelAdmin):
     list_display = ('id', 'last_data', 'status', 'answer', 'newsletter',)
     list_filter = ('status', 'answer', 'newsletter',)
+
+
+@admin.register(Delivery)
+class DeliveryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'created_at', 'email', 'status', 'code', 'latency', 'newsletter',)
+    list_filter = ('status', 'code',)
+    search_fields = ('email',)
+    raw_id_fields = ('attempt', 'newsletter',)
+
+
+@admin.register(DeliveryRetry)
+class DeliveryRetryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'email', 'newsletter', 'attempts', 'next_try_at', 'last_error',)
+    search_fields = ('email',)
+    raw_id_fields = ('newsletter',)
+
+
+@admin.register(DeliveryStat)
+class DeliveryStatAdmin(admin.ModelAdmin):
+    list_display = ('day', 'newsletter', 'owner', 'sent', 'failed', 'success_rate',)
+    list_filter = ('day', 'owner',)
+
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ('id', 'created_at', 'recipient', 'subject', 'status', 'attempts', 'next_try_at',)
+    list_filter = ('status',)
+    search_fields = ('recipient',)
+    # текст служебных писем содержит ссылки подтверждения почты и смены пароля
+    exclude = ('body',)
+
+
+@admin.register(Suppression)
+class SuppressionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'email', 'reason', 'answer', 'created_at',)
+    list_filter = ('reason',)
+    search_fields = ('email',)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class EmailNewsletterConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'email_newsletter'
+
+    def ready(self):
+        # подключение обработчиков сигналов
+        import email_newsletter.signals  # noqa: F401
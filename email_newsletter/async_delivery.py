@@ -0,0 +1,137 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail.message import sanitize_address
+
+from email_newsletter.delivery import (
+    DATA_ERROR,
+    RECIPIENT_ERROR,
+    SENDER_ERROR,
+    SESSION_ERROR,
+    DeliveryResult,
+    MailDelivery,
+    batched,
+)
+
+try:
+    import aiosmtplib
+except ImportError:
+    aiosmtplib = None
+
+# единственный EMAIL_BACKEND, вместо которого можно отправлять письма через aiosmtplib
+SMTP_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
+
+
+class AsyncMailDelivery(MailDelivery):
+    """
+    Отправка писем на asyncio: concurrency SMTP-сессий одновременно из одного потока.
+    Интерфейс и результаты (DeliveryResult) - как у MailDelivery, поэтому журнал
+    попыток, повторы и исключение адресов работают одинаково для обоих режимов
+    """
+
+    def __init__(self, from_email=None, batch_size=None, concurrency=None, rate_limiter=None):
+        if aiosmtplib is None:
+            raise ImproperlyConfigured(
+                "Для EMAIL_DELIVERY_MODE=async установите пакет aiosmtplib"
+            )
+        super().__init__(from_email, batch_size, rate_limiter=rate_limiter)
+        self.concurrency = concurrency or settings.EMAIL_ASYNC_CONCURRENCY
+
+    def send_messages(self, messages):
+        """
+        Отправка готовых писем (EmailMessage с одним получателем),
+        возвращает генератор DeliveryResult в порядке писем.
+        Письма читаются порциями, цикл событий работает только на время
+        отправки порции - между порциями генератор может обращаться к БД
+        """
+        loop = asyncio.new_event_loop()
+        sessions = []
+        try:
+            for batch in batched(messages, self.batch_size * self.concurrency):
+                yield from loop.run_until_complete(self._send_batch(batch, sessions))
+        finally:
+            loop.run_until_complete(self._close(sessions))
+            loop.close()
+
+    @staticmethod
+    def _new_session():
+        return aiosmtplib.SMTP(
+            hostname=settings.EMAIL_HOST,
+            port=int(settings.EMAIL_PORT),
+            username=settings.EMAIL_HOST_USER or None,
+            password=settings.EMAIL_HOST_PASSWORD or None,
+            use_tls=settings.EMAIL_USE_SSL,
+            start_tls=settings.EMAIL_USE_TLS,
+            timeout=settings.EMAIL_TIMEOUT or 60,
+        )
+
+    async def _send_batch(self, batch, sessions):
+        """
+        Отправка порции писем: каждая сессия берет следующее письмо из общей очереди
+        """
+        queue = asyncio.Queue()
+        for index, message in enumerate(batch):
+            queue.put_nowait((index, message))
+        results = [None] * len(batch)
+        workers = min(self.concurrency, len(batch))
+        while len(sessions) < workers:
+            sessions.append(self._new_session())
+        await asyncio.gather(
+            *(self._worker(session, queue, results) for session in sessions[:workers])
+        )
+        return results
+
+    async def _worker(self, session, queue, results):
+        while not queue.empty():
+            index, message = queue.get_nowait()
+            results[index] = await self._send_one(session, message)
+
+    async def _send_one(self, session, message):
+        """
+        Отправка одного письма через сессию (подключение - при первой отправке)
+        """
+        email = message.to[0]
+        delay = self.rate_limiter.reserve(message.from_email, email)
+        if delay:
+            await asyncio.sleep(delay)
+        encoding = message.encoding or settings.DEFAULT_CHARSET
+        sender = sanitize_address(message.from_email, encoding)
+        recipient = sanitize_address(email, encoding)
+        payload = message.message().as_bytes(linesep="\r\n")
+        started = time.monotonic()
+        try:
+            try:
+                if not session.is_connected:
+                    await session.connect()
+                await session.sendmail(sender, [recipient], payload)
+            except aiosmtplib.SMTPServerDisconnected:
+                # сервер закрыл соединение: переподключаемся один раз
+                session.close()
+                await session.connect()
+                await session.sendmail(sender, [recipient], payload)
+        except aiosmtplib.SMTPRecipientsRefused as e:
+            refused = e.recipients[0]
+            return self._failure(email, started, e, refused.code, refused.message, RECIPIENT_ERROR)
+        except aiosmtplib.SMTPSenderRefused as e:
+            return self._failure(email, started, e, e.code, e.message, SENDER_ERROR)
+        except aiosmtplib.SMTPDataError as e:
+            return self._failure(email, started, e, e.code, e.message, DATA_ERROR)
+        except aiosmtplib.SMTPResponseException as e:
+            return self._failure(email, started, e, e.code, e.message, SESSION_ERROR)
+        except (aiosmtplib.SMTPException, OSError) as e:
+            return self._failure(email, started, e, error_type=SESSION_ERROR)
+        return DeliveryResult(
+            email=email, is_sent=True, code=250, latency=time.monotonic() - started
+        )
+
+    @staticmethod
+    async def _close(sessions):
+        for session in sessions:
+            if not session.is_connected:
+                continue
+            try:
+                await session.quit()
+            except (aiosmtplib.SMTPException, OSError):
+                session.close()
@@ -1,175 +1,452 @@
-import smtplib
-from datetime import datetime
+import logging
+import os
+import socket
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
 
+import django
 import pytz
-from django.core.mail import send_mail
-
-from config import settings
-from email_newsletter.models import Newsletter, Message, Attempt
-
-
-def get_next_attempt_date(
-    newsletter_periodicity, current_datetime, last_attempt_last_data
-):
-    """Получить дату следующей попытки
-    (периодичность, текущее время, дата последней попытки),
-    возвращает Bool"""
-    # *количество дней
-    if (
-        newsletter_periodicity == "Один раз в день"
-        and (current_datetime - last_attempt_last_data).days >= 1
-    ):
-        return True
-    # *количество недель
-    if (
-        newsletter_periodicity == "Один раз в неделю"
-        and (current_datetime - last_attempt_last_data).days >= 7
-    ):
-        return True
-    # *количество месяцев
-    if (
-        newsletter_periodicity == "Один раз в месяц"
-        and (current_datetime - last_attempt_last_data).month >= 1
-    ):
-        return True
-
-
-def send_message(instance_newsletter):
-    """
-    Отправка сообщения
-    """
-    messages = Message.objects.get(newsletter=instance_newsletter.pk)
-    for client in instance_newsletter.client.all():
-        # print(messages.body)
-        send_mail(
-            subject=f"{messages.subject}",
-            message=f"'{messages.body}",
-            from_email=settings.EMAIL_HOST_USER,
-            recipient_list=[client.email],
-            fail_silently=False,
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from email_newsletter.async_delivery import SMTP_BACKEND, AsyncMailDelivery
+from email_newsletter.delivery import MailDelivery, batched, reset_connection_pool
+from email_newsletter.func import backoff_delay
+from email_newsletter.locks import scheduler_lock
+from email_newsletter.ratelimit import reset_rate_limiter
+from email_newsletter.models import Newsletter, Attempt, Delivery, DeliveryRetry
+from email_newsletter.rendering import NewsletterRenderer
+from email_newsletter.stats import record_delivery_stat
+from email_newsletter.suppression import get_suppressed, is_hard_bounce, suppress
+
+logger = logging.getLogger(__name__)
+
+# обработчик, захвативший рассылку (сервер и процесс)
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def iter_recipients(newsletter):
+    """
+    Получатели рассылки (адрес, имя) потоком, порциями по RECIPIENT_CHUNK_SIZE:
+    в памяти не держится весь список клиентов. Повторы адреса (сортировка
+    по адресу без учета регистра) и исключенные адреса пропускаются,
+    исключения проверяются одним запросом на порцию
+    """
+    rows = (
+        newsletter.client.order_by(Lower("email"))
+        .values_list("email", "name")
+        .iterator(chunk_size=settings.RECIPIENT_CHUNK_SIZE)
+    )
+    previous = None
+    for chunk in batched(rows, settings.RECIPIENT_CHUNK_SIZE):
+        suppressed = get_suppressed(email for email, name in chunk)
+        for email, name in chunk:
+            key = email.lower()
+            if key != previous and key not in suppressed:
+                yield email, name
+            previous = key
+
+
+def get_mail_delivery():
+    """
+    Отправка писем рассылки: обычная или asyncio (EMAIL_DELIVERY_MODE).
+    asyncio-режим сам подключается к SMTP-серверу, поэтому при другом EMAIL_BACKEND
+    (консоль, файлы, locmem) письма отправляются обычным способом через этот backend
+    """
+    if settings.EMAIL_DELIVERY_MODE == "async":
+        if settings.EMAIL_BACKEND == SMTP_BACKEND:
+            return AsyncMailDelivery()
+        logger.warning(
+            "EMAIL_DELIVERY_MODE=async работает только с %s, задан %s: "
+            "письма отправляются обычным способом",
+            SMTP_BACKEND, settings.EMAIL_BACKEND,
         )
+    return MailDelivery()
 
 
-def my_scheduled_job():
+def send_message(instance_newsletter, recipients=None):
     """
-    Главная функция по отправке рассылки
+    Отправка сообщения клиентам рассылки (либо парам (адрес, имя) recipients),
+    возвращает генератор DeliveryResult. Письмо кодируется один раз за запуск,
+    подстановки в тексте ({{ name }}) заполняются для каждого клиента
     """
-    zone = pytz.timezone(settings.TIME_ZONE)
-    current_datetime = datetime.now(zone)  # текущее время
-    print('привет!')
-    # создание объекта рассылки с применением фильтра
-    # время отправки которых наступило ранее текущего
-    newsletters = Newsletter.objects.filter(start_data__lte=current_datetime)
-
-    for newsletter in newsletters:
-        if (
-                newsletter.is_active
-                and not newsletter.end_data
-                and newsletter.status == "создана"
-                and newsletter.start_data < current_datetime
+    messages = instance_newsletter.message
+    if recipients is None:
+        recipients = iter_recipients(instance_newsletter)
+    delivery = get_mail_delivery()
+    renderer = NewsletterRenderer(messages.subject, messages.body, delivery.from_email)
+    return delivery.send_messages(renderer.build(email, name) for email, name in recipients)
+
+
+class AttemptLog:
+    """
+    Журнал попытки рассылки: результаты по каждому получателю
+    накапливаются и записываются пачками через bulk_create
+    """
+
+    def __init__(self, attempt, lease_owner=None):
+        self.attempt = attempt
+        # обработчик, захвативший рассылку: аренда продлевается по ходу отправки
+        self.lease_owner = lease_owner
+        self.lease_lost = False
+        self._lease_renewed = time.monotonic()
+        self.sent = 0
+        self.failed = 0
+        self.first_error = None
+        self.temporary_failures = []  # результаты, отправку по которым можно повторить
+        self.hard_bounces = []  # адреса, которые нужно исключить из рассылок
+        self.error = None  # ошибка, прервавшая отправку
+        self._deliveries = []
+
+    def add(self, result):
+        if result.is_sent:
+            self.sent += 1
+        else:
+            self.failed += 1
+            self.first_error = self.first_error or result.answer
+            if result.is_temporary_failure:
+                self.temporary_failures.append(result)
+            elif is_hard_bounce(result):
+                self.hard_bounces.append(result)
+        self._deliveries.append(
+            Delivery(
+                attempt=self.attempt,
+                newsletter_id=self.attempt.newsletter_id,
+                owner_id=self.attempt.newsletter.owner_id,
+                email=result.email,
+                status=Attempt.SENT if result.is_sent else Attempt.NOT_SENT,
+                code=result.code,
+                answer=result.answer or None,
+                latency=result.latency,
+            )
+        )
+        if len(self._deliveries) >= settings.DELIVERY_LOG_BATCH_SIZE or (
+            self.lease_owner
+            and time.monotonic() - self._lease_renewed >= settings.NEWSLETTER_LEASE / 3
         ):
-            try:
-                # - отправляем сообщение
-                send_message(newsletter)
-                # - изменить статус на запущена в БД/на завершена у рассылки если разовое
-                if newsletter.periodicity == "Разовая":
-                    newsletter.status = "завершена"
-                else:
-                    newsletter.status = "запущена"
-                newsletter.save()
-                # print(newsletter.status)
-
-                # - создаем попытку
-                new_attempt = Attempt.objects.create(
-                    last_data=current_datetime,
-                    status="отправлено",
-                    newsletter=newsletter,
-                )
-                new_attempt.save()
-            except smtplib.SMTPException as e:
-                # При ошибке почтовика получаем ответ сервера - ошибка, которая записывается в е
-                # print(e)
-                new_attempt = Attempt.objects.create(
-                    last_data=current_datetime,
-                    status="не отправлено",
-                    newsletter=newsletter,
-                    answer=e,
+            self.flush()
+
+    def flush(self):
+        if self._deliveries:
+            Delivery.objects.bulk_create(self._deliveries)
+            self._deliveries = []
+        if self.hard_bounces:
+            suppress(self.hard_bounces)
+            self.hard_bounces = []
+        if self.lease_owner:
+            self.renew_lease()
+
+    def renew_lease(self):
+        """
+        Продление аренды рассылки на NEWSLETTER_LEASE, пока она принадлежит
+        этому обработчику (иначе lease_lost - отправку нужно прервать)
+        """
+        self._lease_renewed = time.monotonic()
+        extended = Newsletter.objects.filter(pk=self.attempt.newsletter_id).extend_lease(
+            timezone.now(), self.lease_owner, settings.NEWSLETTER_LEASE
+        )
+        self.lease_lost = not extended
+
+    def finish(self):
+        """
+        Итог попытки: отправлено, если письмо получил хотя бы один клиент
+        (или получателей нет), в ответе - количество недоставленных и первая ошибка
+        либо ошибка, прервавшая отправку
+        """
+        self.flush()
+        if self.sent or not (self.failed or self.error):
+            self.attempt.status = Attempt.SENT
+            self.attempt.answer = None
+        if self.error:
+            self.attempt.answer = (
+                f"отправка прервана (отправлено {self.sent}, не доставлено {self.failed}): "
+                f"{self.error}"
+            )
+        elif self.failed:
+            self.attempt.answer = (
+                f"отправлено {self.sent}, не доставлено {self.failed}: {self.first_error}"
+            )
+        self.attempt.save(update_fields=["status", "answer"])
+        record_delivery_stat(self.attempt.newsletter, self.attempt.last_data, self.sent, self.failed)
+
+
+def get_retry_time(current_datetime, attempts):
+    """
+    Время повторной отправки после attempts неудачных попыток
+    """
+    delay = backoff_delay(
+        attempts, settings.NEWSLETTER_RETRY_DELAY, settings.NEWSLETTER_RETRY_MAX_DELAY
+    )
+    return current_datetime + timedelta(seconds=delay)
+
+
+def schedule_retries(newsletter, results, current_datetime):
+    """
+    Постановка получателей с временной ошибкой в очередь повторной отправки
+    """
+    DeliveryRetry.objects.bulk_create(
+        (
+            DeliveryRetry(
+                newsletter=newsletter,
+                email=result.email,
+                attempts=1,
+                next_try_at=get_retry_time(current_datetime, 1),
+                last_error=result.answer,
+            )
+            for result in results
+        ),
+        batch_size=settings.DELIVERY_LOG_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["newsletter", "email"],
+        update_fields=["attempts", "next_try_at", "last_error"],
+    )
+
+
+def send_newsletter(newsletter, current_datetime, worker=None):
+    """
+    Отправка рассылки клиентам; смена статуса рассылки, итог попытки
+    и постановка в очередь повторов записываются в одной транзакции.
+    worker - обработчик, захвативший рассылку: аренда продлевается во время отправки,
+    а статус и время следующей отправки сохраняются, только пока аренда за ним.
+    Ошибка во время отправки записывается в итог попытки, аренда при этом снимается
+    """
+    attempt_log = AttemptLog(
+        Attempt.objects.create(
+            last_data=current_datetime, status=Attempt.NOT_SENT, newsletter=newsletter
+        ),
+        lease_owner=worker,
+    )
+    try:
+        for result in send_message(newsletter):
+            attempt_log.add(result)
+            if attempt_log.lease_lost:
+                logger.warning(
+                    "Рассылку %s захватил другой обработчик, отправка прервана", newsletter.pk
                 )
-                new_attempt.save()
-
-        if (newsletter.is_active
-                and newsletter.end_data
-                and newsletter.status in ("запущена", "создана",)
-                and current_datetime > newsletter.end_data):
-            newsletter.status = "завершена"
-            newsletter.save()
-
-        if (
-                newsletter.is_active
-                and newsletter.end_data
-                and newsletter.status == "создана"
-                and (newsletter.start_data < current_datetime < newsletter.end_data)
+                break
+    except Exception as e:
+        # попытка все равно завершается, а аренда снимается - иначе рассылка
+        # остается захваченной и после истечения аренды падает снова и снова
+        attempt_log.error = repr(e)
+        raise
+    finally:
+        finish_newsletter(newsletter, attempt_log, current_datetime, worker)
+
+
+def finish_newsletter(newsletter, attempt_log, current_datetime, worker=None):
+    """
+    Итог попытки, смена статуса и времени следующей отправки рассылки,
+    снятие аренды и постановка в очередь повторов - в одной транзакции
+    """
+    with transaction.atomic():
+        # - итог попытки
+        attempt_log.finish()
+        if worker and not (
+            Newsletter.objects.select_for_update()
+            .filter(pk=newsletter.pk, locked_by=worker)
+            .exists()
         ):
-            try:
-                # - отправляем сообщение
-                send_message(newsletter)
-                # - изменить статус на запущена в БД/на завершена у рассылки если разовое
-                if newsletter.periodicity == "Разовая":
-                    newsletter.status = "завершена"
-                else:
-                    newsletter.status = "запущена"
-                newsletter.save()
-                # print(newsletter.status)
-
-                # - создаем попытку
-                new_attempt = Attempt.objects.create(
-                    last_data=current_datetime,
-                    status="отправлено",
-                    newsletter=newsletter,
-                )
-                new_attempt.save()
-            except smtplib.SMTPException as e:
-                # При ошибке почтовика получаем ответ сервера - ошибка, которая записывается в е
-                # print(e)
-                new_attempt = Attempt.objects.create(
-                    last_data=current_datetime,
-                    status="не отправлено",
-                    newsletter=newsletter,
-                    answer=e,
-                )
-                new_attempt.save()
-
-        if (newsletter.is_active
-                and newsletter.status == "запущена" and
-                (not newsletter.end_data or (current_datetime < newsletter.end_data))):
-            # print(newsletter.status)
-            last_attempt = (
-                Attempt.objects.filter(newsletter=newsletter.pk).order_by("last_data").last()
+            # рассылку обрабатывает другой обработчик: ее состояние не трогаем
+            return
+        # - изменить статус на запущена в БД/на завершена у рассылки если разовое
+        if newsletter.status == Newsletter.CREATED:
+            if newsletter.periodicity == Newsletter.ONE_TIME:
+                newsletter.status = Newsletter.COMPLETED
+            else:
+                newsletter.status = Newsletter.LAUNCHED
+        newsletter.next_run_at = newsletter.get_next_run_at(current_datetime)
+        # - снять аренду планировщика
+        newsletter.locked_until = newsletter.locked_by = None
+        newsletter.save(update_fields=["status", "next_run_at", "locked_until", "locked_by"])
+        # - клиентам с временной ошибкой письмо отправится повторно
+        schedule_retries(newsletter, attempt_log.temporary_failures, current_datetime)
+
+
+def claim_retries(current_datetime, batch_size):
+    """
+    Выбор повторов, время которых наступило; выбранные повторы
+    откладываются на NEWSLETTER_RETRY_LEASE секунд, чтобы параллельный запуск их не взял
+    """
+    with transaction.atomic():
+        retries = list(
+            DeliveryRetry.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(next_try_at__lte=current_datetime, newsletter__is_active=True)
+            .order_by("next_try_at")[:batch_size]
+        )
+        DeliveryRetry.objects.filter(pk__in=[retry.pk for retry in retries]).update(
+            next_try_at=current_datetime + timedelta(seconds=settings.NEWSLETTER_RETRY_LEASE)
+        )
+    return retries
+
+
+def process_retries(current_datetime):
+    """
+    Повторная отправка писем клиентам, получившим временную ошибку:
+    с экспоненциальной задержкой, не более NEWSLETTER_RETRY_MAX_ATTEMPTS попыток
+    """
+    retries = claim_retries(current_datetime, settings.NEWSLETTER_RETRY_BATCH_SIZE)
+    pending = defaultdict(dict)
+    for retry in retries:
+        pending[retry.newsletter_id][retry.email] = retry
+    newsletters = Newsletter.objects.select_related("message").in_bulk(list(pending))
+    for newsletter_pk, newsletter_retries in pending.items():
+        newsletter = newsletters[newsletter_pk]
+        attempt_log = AttemptLog(
+            Attempt.objects.create(
+                last_data=current_datetime, status=Attempt.NOT_SENT, newsletter=newsletter
             )
-            print(last_attempt, newsletter.message)
-            if get_next_attempt_date(
-                newsletter.periodicity, current_datetime, last_attempt.last_data
+        )
+        # адреса, исключенные после постановки в очередь, не отправляются
+        suppressed = get_suppressed(newsletter_retries)
+        done = [
+            retry.pk for email, retry in newsletter_retries.items() if email.lower() in suppressed
+        ]
+        emails = [email for email in newsletter_retries if email.lower() not in suppressed]
+        # имена клиентов для подстановки в текст сообщения
+        names = dict(newsletter.client.filter(email__in=emails).values_list("email", "name"))
+        recipients = [(email, names.get(email, "")) for email in emails]
+        postponed = []
+        for result in send_message(newsletter, recipients=recipients):
+            attempt_log.add(result)
+            retry = newsletter_retries[result.email]
+            if (
+                result.is_temporary_failure
+                and retry.attempts < settings.NEWSLETTER_RETRY_MAX_ATTEMPTS
             ):
-                try:
-                    # - отправляем сообщение
-                    send_message(newsletter)
-
-                    # - создаем попытку
-                    new_attempt = Attempt.objects.create(
-                        last_data=current_datetime,
-                        status="отправлено",
-                        newsletter=newsletter,
-                    )
-                    new_attempt.save()
-                    print(new_attempt)
-
-                except smtplib.SMTPException as e:
-                    # При ошибке почтовика получаем ответ сервера - ошибка, которая записывается в е
-                    print(f"Ошибка {e}")
-                    new_attempt = Attempt.objects.create(
-                        last_data=current_datetime,
-                        status="не отправлено",
-                        newsletter=newsletter,
-                        answer=e,
-                    )
-                    new_attempt.save()
+                retry.attempts += 1
+                retry.next_try_at = get_retry_time(current_datetime, retry.attempts)
+                retry.last_error = result.answer
+                postponed.append(retry)
+            else:
+                done.append(retry.pk)
+        with transaction.atomic():
+            attempt_log.finish()
+            DeliveryRetry.objects.bulk_update(postponed, ["attempts", "next_try_at", "last_error"])
+            DeliveryRetry.objects.filter(pk__in=done).delete()
+
+
+def process_newsletter(newsletter_pk, current_datetime, worker=None):
+    """
+    Обработка одной рассылки, срок отправки которой подошел
+    (захваченной обработчиком worker)
+    """
+    newsletter = Newsletter.objects.select_related("message").get(pk=newsletter_pk)
+    if worker and newsletter.locked_by != worker:
+        logger.warning("Рассылку %s захватил другой обработчик, пропущена", newsletter_pk)
+        return
+    send_newsletter(newsletter, current_datetime, worker)
+
+
+def _init_worker():
+    """
+    Подготовка дочернего процесса пула
+    """
+    django.setup()
+    reset_connection_pool()
+    reset_rate_limiter()
+
+
+def _process_in_worker(newsletter_pk, current_datetime, worker, keep_connections=False):
+    """
+    Обработка рассылки в потоке/процессе пула; соединения с БД закрываются,
+    а в постоянном пуле (keep_connections) - только устаревшие и сломанные
+    """
+    try:
+        process_newsletter(newsletter_pk, current_datetime, worker)
+    finally:
+        if keep_connections:
+            close_old_connections()
+        else:
+            connections.close_all()
+
+
+def create_executor():
+    """
+    Пул потоков или процессов для обработки рассылок (NEWSLETTER_DISPATCH_MODE)
+    """
+    if settings.NEWSLETTER_DISPATCH_MODE == "process":
+        return ProcessPoolExecutor(
+            max_workers=settings.NEWSLETTER_WORKERS, initializer=_init_worker
+        )
+    return ThreadPoolExecutor(max_workers=settings.NEWSLETTER_WORKERS)
+
+
+def dispatch_newsletters(newsletter_pks, current_datetime, executor=None):
+    """
+    Параллельная обработка рассылок пулом потоков или процессов
+    (NEWSLETTER_DISPATCH_MODE, NEWSLETTER_WORKERS):
+    медленный почтовый сервер одной рассылки не задерживает остальные.
+    executor - постоянный пул долгоживущего планировщика, иначе пул создается на один запуск
+    """
+    workers = settings.NEWSLETTER_WORKERS
+    if workers <= 1 or len(newsletter_pks) <= 1:
+        for newsletter_pk in newsletter_pks:
+            try:
+                process_newsletter(newsletter_pk, current_datetime, WORKER_ID)
+            except Exception:
+                logger.exception("Ошибка обработки рассылки %s", newsletter_pk)
+        return
+
+    if executor is None:
+        with create_executor() as executor:
+            _run_in_executor(executor, newsletter_pks, current_datetime, False)
+    else:
+        _run_in_executor(executor, newsletter_pks, current_datetime, True)
+
+
+def _run_in_executor(executor, newsletter_pks, current_datetime, keep_connections):
+    if isinstance(executor, ProcessPoolExecutor):
+        # дочерние процессы не должны получить открытое соединение с БД родителя
+        connections.close_all()
+    futures = {
+        executor.submit(
+            # идентификатор родителя: рассылки захвачены им, а не дочерним процессом
+            _process_in_worker, newsletter_pk, current_datetime, WORKER_ID, keep_connections
+        ): newsletter_pk
+        for newsletter_pk in newsletter_pks
+    }
+    for future in as_completed(futures):
+        try:
+            future.result()
+        except Exception:
+            logger.exception("Ошибка обработки рассылки %s", futures[future])
+
+
+def run_scheduled_job(executor=None):
+    """
+    Отправка рассылок, срок которых наступил, и повторов
+    """
+    zone = pytz.timezone(settings.TIME_ZONE)
+    current_datetime = datetime.now(zone)  # текущее время
+    # завершение рассылок, время которых истекло
+    Newsletter.objects.finish_expired(current_datetime)
+    # рассылки, срок отправки которых наступил (захваченные этим обработчиком)
+    newsletter_pks = Newsletter.objects.claim_due(
+        current_datetime,
+        WORKER_ID,
+        settings.NEWSLETTER_LEASE,
+        settings.NEWSLETTER_CLAIM_BATCH_SIZE,
+    )
+    dispatch_newsletters(newsletter_pks, current_datetime, executor)
+    # повторная отправка клиентам, получившим временную ошибку
+    process_retries(current_datetime)
+
+
+def my_scheduled_job():
+    """
+    Главная функция по отправке рассылки (задание crontab).
+    При SCHEDULER_SINGLE_INSTANCE пропускается, пока работает другой запуск
+    или планировщик run_scheduler
+    """
+    if not settings.SCHEDULER_SINGLE_INSTANCE:
+        run_scheduled_job()
+        return
+    with scheduler_lock() as acquired:
+        if not acquired:
+            logger.info("Планировщик рассылок уже запущен, запуск пропущен")
+            return
+        run_scheduled_job()
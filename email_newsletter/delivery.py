@@ -0,0 +1,239 @@
+import logging
+import queue
+import smtplib
+import threading
+import time
+from dataclasses import dataclass
+from itertools import islice
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+from email_newsletter.ratelimit import get_rate_limiter
+from email_newsletter.rendering import NewsletterRenderer
+
+logger = logging.getLogger(__name__)
+
+# вид ошибки отправки: отказ по адресу получателя, по адресу отправителя,
+# отказ в приеме письма (содержимое, квота), ошибка соединения или сессии
+RECIPIENT_ERROR = "recipient"
+SENDER_ERROR = "sender"
+DATA_ERROR = "data"
+SESSION_ERROR = "session"
+
+
+@dataclass
+class DeliveryResult:
+    """
+    Результат отправки сообщения одному получателю
+    """
+    email: str
+    is_sent: bool
+    code: int | None = None  # код ответа почтового сервера
+    answer: str = ""  # текст ответа почтового сервера
+    latency: float = 0.0  # время отправки, сек
+    error_type: str = ""  # вид ошибки (RECIPIENT_ERROR, SENDER_ERROR, ...)
+
+    @property
+    def is_temporary_failure(self):
+        """
+        Временная ошибка (сеть, коды 4xx) - отправку можно повторить
+        """
+        return not self.is_sent and (self.code is None or 400 <= self.code < 500)
+
+
+def batched(iterable, size):
+    """
+    Разбивает итерируемый объект на списки длиной не более size
+    """
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def is_connection_alive(connection):
+    """
+    Проверка, что открытое SMTP-соединение еще принимает команды
+    """
+    smtp = getattr(connection, "connection", False)
+    if smtp is False:
+        # не SMTP-бэкенд (console, locmem): соединения как такового нет
+        return True
+    if smtp is None:
+        return False
+    try:
+        return smtp.noop()[0] == 250
+    except (smtplib.SMTPException, OSError):
+        return False
+
+
+class ConnectionPool:
+    """
+    Пул открытых (авторизованных) SMTP-соединений.
+    Соединение берется из пула на время отправки пачки писем и возвращается обратно,
+    поэтому рукопожатие TLS и авторизация выполняются один раз на много писем.
+    """
+
+    def __init__(self, size=None, idle_timeout=None):
+        self.size = size or settings.EMAIL_POOL_SIZE
+        self.idle_timeout = idle_timeout or settings.EMAIL_POOL_IDLE_TIMEOUT
+        self._idle = queue.LifoQueue()  # (соединение, время возврата в пул)
+
+    def acquire(self):
+        """
+        Свободное соединение из пула либо новое
+        """
+        while True:
+            try:
+                connection, released_at = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if (
+                time.monotonic() - released_at < self.idle_timeout
+                and is_connection_alive(connection)
+            ):
+                return connection
+            connection.close()
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+        except OSError as e:
+            if isinstance(e, smtplib.SMTPException):
+                raise
+            # сервер недоступен: отдаем ошибку в том же виде, что и остальные ошибки почтовика
+            raise smtplib.SMTPConnectError(-1, str(e)) from e
+        return connection
+
+    def release(self, connection):
+        """
+        Вернуть соединение в пул (лишние закрываются)
+        """
+        # соединение, закрытое при ошибке отправки, в пул не возвращаем
+        is_open = getattr(connection, "connection", True) is not None
+        if is_open and self._idle.qsize() < self.size:
+            self._idle.put((connection, time.monotonic()))
+        else:
+            connection.close()
+
+    def close(self):
+        """
+        Закрыть все свободные соединения
+        """
+        while True:
+            try:
+                connection, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            connection.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_connection_pool():
+    """
+    Общий для процесса пул SMTP-соединений
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
+
+
+def reset_connection_pool():
+    """
+    Сброс пула без закрытия соединений - для дочернего процесса после fork:
+    унаследованные сокеты принадлежат родителю и использовать их нельзя
+    """
+    global _pool
+    _pool = None
+
+
+class MailDelivery:
+    """
+    Отправка писем пачками через переиспользуемые SMTP-соединения
+    с результатом по каждому получателю
+    """
+
+    def __init__(self, from_email=None, batch_size=None, pool=None, rate_limiter=None):
+        self.from_email = from_email or settings.EMAIL_HOST_USER
+        self.batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+        self.pool = pool or get_connection_pool()
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+
+    def send(self, subject, body, recipients):
+        """
+        Отправка сообщения каждому адресу из recipients (письмо кодируется один раз),
+        возвращает генератор DeliveryResult (по одному на получателя)
+        """
+        renderer = NewsletterRenderer(subject, body, self.from_email)
+        return self.send_messages(renderer.build(email) for email in recipients)
+
+    def send_messages(self, messages):
+        """
+        Отправка готовых писем (EmailMessage с одним получателем),
+        возвращает генератор DeliveryResult
+        """
+        for batch in batched(messages, self.batch_size):
+            try:
+                connection = self.pool.acquire()
+            except smtplib.SMTPException as e:
+                # сервер недоступен: ошибка по каждому письму пачки, остальные пачки
+                # пробуют подключиться заново
+                started = time.monotonic()
+                for message in batch:
+                    yield self._failure(message.to[0], started, e, error_type=SESSION_ERROR)
+                continue
+            try:
+                for message in batch:
+                    yield self._send_one(connection, message)
+            finally:
+                self.pool.release(connection)
+
+    def _send_one(self, connection, message):
+        """
+        Отправка одного письма через открытое соединение
+        """
+        email = message.to[0]
+        self.rate_limiter.wait(message.from_email, email)
+        started = time.monotonic()
+        try:
+            try:
+                connection.send_messages([message])
+            except smtplib.SMTPServerDisconnected:
+                # сервер закрыл соединение (таймаут простоя, лимит писем на сессию):
+                # переподключаемся один раз
+                connection.close()
+                connection.open()
+                connection.send_messages([message])
+        except smtplib.SMTPRecipientsRefused as e:
+            code, answer = e.recipients.get(email, (None, b""))
+            return self._failure(email, started, e, code, answer, RECIPIENT_ERROR)
+        except smtplib.SMTPSenderRefused as e:
+            return self._failure(email, started, e, e.smtp_code, e.smtp_error, SENDER_ERROR)
+        except smtplib.SMTPDataError as e:
+            return self._failure(email, started, e, e.smtp_code, e.smtp_error, DATA_ERROR)
+        except smtplib.SMTPResponseException as e:
+            return self._failure(email, started, e, e.smtp_code, e.smtp_error, SESSION_ERROR)
+        except OSError as e:
+            # smtplib.SMTPException и сетевые ошибки
+            return self._failure(email, started, e, error_type=SESSION_ERROR)
+        return DeliveryResult(
+            email=email, is_sent=True, code=250, latency=time.monotonic() - started
+        )
+
+    @staticmethod
+    def _failure(email, started, error, code=None, answer=None, error_type=SESSION_ERROR):
+        if isinstance(answer, bytes):
+            answer = answer.decode(errors="replace")
+        logger.warning("Письмо для %s не отправлено: %s", email, error)
+        return DeliveryResult(
+            email=email,
+            is_sent=False,
+            code=code,
+            answer=answer or str(error),
+            latency=time.monotonic() - started,
+            error_type=error_type,
+        )
@@ -0,0 +1,68 @@
+import csv
+import json
+
+from django.conf import settings
+from django.utils import timezone
+
+from email_newsletter.services import get_report_deliveries
+
+# столбцы выгрузки отчета: (поле, заголовок)
+REPORT_COLUMNS = (
+    ("created_at", "время отправки"),
+    ("newsletter_id", "рассылка"),
+    ("newsletter__message__subject", "тема сообщения"),
+    ("attempt_id", "попытка"),
+    ("attempt__status", "статус попытки"),
+    ("email", "адрес"),
+    ("status", "статус"),
+    ("code", "код ответа"),
+    ("answer", "ответ почтового сервера"),
+    ("latency", "время отправки, сек"),
+)
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/jsonl; charset=utf-8",
+}
+
+
+class Echo:
+    """
+    Псевдо-файл для csv.writer: возвращает записанную строку, а не копит ее
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_report_rows(user, date_from=None, date_to=None):
+    """
+    Строки отчета отправок пользователя потоком (серверный курсор, только нужные столбцы)
+    """
+    fields = [name for name, title in REPORT_COLUMNS]
+    rows = (
+        get_report_deliveries(user, date_from, date_to)
+        .values_list(*fields)
+        .iterator(chunk_size=settings.REPORT_EXPORT_CHUNK_SIZE)
+    )
+    for row in rows:
+        # время - в часовом поясе проекта
+        yield (timezone.localtime(row[0]).isoformat(), *row[1:])
+
+
+def iter_report_csv(rows):
+    """
+    Отчет в CSV построчно (с BOM, чтобы кириллица открывалась в Excel)
+    """
+    writer = csv.writer(Echo())
+    yield "\ufeff" + writer.writerow([title for name, title in REPORT_COLUMNS])
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def iter_report_jsonl(rows):
+    """
+    Отчет в JSON Lines: объект на строку
+    """
+    fields = [name for name, title in REPORT_COLUMNS]
+    for row in rows:
+        yield json.dumps(dict(zip(fields, row)), ensure_ascii=False) + "\n"
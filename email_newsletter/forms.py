@@ -1,6 +1,7 @@
 from django.forms import BooleanField
 from django import forms
 
+from email_newsletter.imports import get_import_format
 from email_newsletter.models import Newsletter, Client, Message
 
 
@@ -57,6 +58,9 @@ class NewsletterForm(StyleFormMixin, forms.Form, forms.ModelForm):
             "status",
             "owner",
             "is_active",
+            "next_run_at",
+            "locked_until",
+            "locked_by",
         )
 
 
@@ -114,6 +118,9 @@ class NewsletterModeratorOwnerForm(StyleFormMixin, forms.ModelForm):
         exclude = (
             "status",
             "owner",
+            "next_run_at",
+            "locked_until",
+            "locked_by",
         )
 
 
@@ -136,3 +143,33 @@ class MessageForm(StyleFormMixin, forms.ModelForm):
             "subject",
             "body"
         )
+
+
+class MailingReportFilterForm(StyleFormMixin, forms.Form):
+    date_from = forms.DateField(
+        required=False,
+        label="с",
+        widget=forms.DateInput(attrs={"type": "date"}),
+    )
+    date_to = forms.DateField(
+        required=False,
+        label="по",
+        widget=forms.DateInput(attrs={"type": "date"}),
+    )
+    # ключи страницы отчета (pk отправки, после/перед которой начинается страница)
+    after = forms.IntegerField(required=False, min_value=1, widget=forms.HiddenInput)
+    before = forms.IntegerField(required=False, min_value=1, widget=forms.HiddenInput)
+
+
+class ClientImportForm(StyleFormMixin, forms.Form):
+    file = forms.FileField(
+        label="Файл клиентов",
+        help_text="CSV с заголовком email,name,message либо JSON/JSONL с объектами "
+        '{"email": ..., "name": ..., "message": ...} в кодировке UTF-8',
+    )
+
+    def clean_file(self):
+        uploaded = self.cleaned_data["file"]
+        if get_import_format(uploaded.name) is None:
+            raise forms.ValidationError("Поддерживаются файлы .csv, .json и .jsonl")
+        return uploaded
@@ -0,0 +1,29 @@
+import calendar
+
+
+def add_months(value, months):
+    """
+    Сдвиг даты/времени на целое число календарных месяцев
+    (31 января + 1 месяц = 28/29 февраля)
+    """
+    month_index = value.month - 1 + months
+    year = value.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(value.day, calendar.monthrange(year, month)[1])
+    return value.replace(year=year, month=month, day=day)
+
+
+def success_rate(sent, failed):
+    """
+    Процент успешно отправленных сообщений (None, если отправок не было)
+    """
+    total = (sent or 0) + (failed or 0)
+    return round(sent * 100 / total, 1) if total else None
+
+
+def backoff_delay(attempts, base, maximum):
+    """
+    Экспоненциальная задержка перед повторной попыткой, сек
+    (base, 2 * base, 4 * base ... но не более maximum)
+    """
+    return min(base * 2 ** max(attempts - 1, 0), maximum)
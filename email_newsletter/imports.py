@@ -0,0 +1,174 @@
+import csv
+import io
+import json
+import os
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from email_newsletter.delivery import batched
+from email_newsletter.models import Client
+from email_newsletter.services import clear_homepage_stats
+
+# размер порции чтения JSON-файла, символов
+JSON_READ_SIZE = 64 * 1024
+# количество ошибочных строк, попадающих в отчет
+MAX_REPORTED_ERRORS = 20
+
+
+@dataclass
+class ImportResult:
+    """
+    Итог загрузки клиентов
+    """
+    created: int = 0
+    duplicates: int = 0  # уже есть у владельца или повторяются в файле
+    invalid: int = 0
+    errors: list = field(default_factory=list)  # первые ошибочные строки
+    error: str = ""  # ошибка чтения файла, прервавшая загрузку
+
+    def add_error(self, row_number, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"запись {row_number}: {message}")
+
+
+def get_import_format(file_name):
+    """
+    Формат файла по расширению: csv, json (массив объектов) или jsonl (объект в строке)
+    """
+    extension = os.path.splitext(file_name)[1].lower().lstrip(".")
+    return extension if extension in ("csv", "json", "jsonl") else None
+
+
+def iter_csv_rows(stream):
+    """
+    Строки CSV-файла с заголовком (email, name, message) словарями, по одной
+    """
+    reader = csv.DictReader(stream)
+    if reader.fieldnames:
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    yield from reader
+
+
+def iter_jsonl_rows(stream):
+    """
+    Объекты JSON Lines, по одному на строку
+    """
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_json_rows(stream):
+    """
+    Объекты JSON-массива [{...}, {...}] по одному: файл читается порциями,
+    целиком в памяти не держится
+    """
+    decoder = json.JSONDecoder()
+    buffer = stream.read(JSON_READ_SIZE).lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("ожидается JSON-массив объектов")
+    position = 1
+    eof = False
+    while True:
+        # пропуск пробелов и запятых между объектами
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if position < len(buffer) and buffer[position] == "]":
+            return
+        try:
+            row, end = decoder.raw_decode(buffer, position)
+            # значение, упирающееся в конец буфера (число), могло быть прочитано не целиком
+            complete = eof or end < len(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            complete = False
+        if not complete:
+            # значение не поместилось в буфер: дочитываем файл
+            chunk = stream.read(JSON_READ_SIZE)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield row
+        position = end
+
+
+def iter_rows(binary_stream, import_format):
+    """
+    Строки файла клиентов (словари) потоком из бинарного файла в UTF-8
+    """
+    stream = io.TextIOWrapper(binary_stream, encoding="utf-8-sig", newline="")
+    if import_format == "csv":
+        return iter_csv_rows(stream)
+    if import_format == "jsonl":
+        return iter_jsonl_rows(stream)
+    return iter_json_rows(stream)
+
+
+def import_clients(owner, rows, batch_size=None):
+    """
+    Загрузка клиентов владельца owner пачками: адреса проверяются валидатором,
+    повторы внутри файла и уже существующие у владельца адреса (без учета регистра)
+    пропускаются, новые клиенты создаются через bulk_create. Ошибка чтения файла
+    прерывает загрузку: уже загруженные пачки остаются, ошибка пишется в result.error
+    """
+    result = ImportResult()
+    batch_size = batch_size or settings.CLIENT_IMPORT_BATCH_SIZE
+    # номер записи в файле для отчета об ошибках
+    numbered_rows = enumerate(rows, start=1)
+    try:
+        for batch in batched(numbered_rows, batch_size):
+            _import_batch(owner, batch, result)
+    except (ValueError, csv.Error) as e:
+        # UnicodeDecodeError и json.JSONDecodeError - тоже ValueError
+        result.error = str(e)
+    if result.created:
+        # bulk_create не отправляет сигналы post_save
+        clear_homepage_stats()
+    return result
+
+
+def _import_batch(owner, batch, result):
+    """
+    Загрузка одной пачки пронумерованных записей, итог добавляется в result
+    """
+    clients = {}
+    for row_number, row in batch:
+        if not isinstance(row, dict):
+            result.add_error(row_number, "ожидается объект с полями email, name")
+            continue
+        email = str(row.get("email") or "").strip()
+        try:
+            validate_email(email)
+        except ValidationError:
+            result.add_error(row_number, f"некорректный адрес {email!r}")
+            continue
+        key = email.lower()
+        if key in clients:
+            result.duplicates += 1
+            continue
+        name = str(row.get("name") or "").strip() or email.partition("@")[0]
+        clients[key] = Client(
+            email=email,
+            name=name[:150],
+            message=row.get("message") or None,
+            owner=owner,
+        )
+    existing = set(
+        Client.objects.filter(owner=owner)
+        .annotate(email_key=Lower("email"))
+        .filter(email_key__in=list(clients))
+        .values_list("email_key", flat=True)
+    )
+    new_clients = [client for key, client in clients.items() if key not in existing]
+    result.duplicates += len(clients) - len(new_clients)
+    with transaction.atomic():
+        Client.objects.bulk_create(new_clients)
+    result.created += len(new_clients)
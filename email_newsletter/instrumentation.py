@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+
+# метрики обрабатываемого запроса (None - вне запроса: cron, команды)
+current_metrics = ContextVar("request_metrics", default=None)
+
+_MISSING = object()
+
+
+class RequestMetrics:
+    """
+    Метрики одного запроса: SQL-запросы, время БД, обращения к кешу, время обработки
+    """
+
+    def __init__(self, track_duplicates=False):
+        self.queries = 0
+        self.db_time = 0.0  # сек
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.latency = 0.0  # сек
+        # количество выполнений каждого текста SQL (для поиска N+1)
+        self.statements = Counter() if track_duplicates else None
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """
+        Обертка выполнения SQL (connection.execute_wrapper): считает запросы и их время
+        """
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            if self.statements is not None:
+                self.statements[sql] += 1
+
+    def record_cache(self, hits, misses):
+        self.cache_hits += hits
+        self.cache_misses += misses
+
+    def get_duplicates(self, threshold):
+        """
+        Тексты SQL, выполненные за запрос не менее threshold раз
+        """
+        if self.statements is None:
+            return {}
+        return {sql: count for sql, count in self.statements.items() if count >= threshold}
+
+    def server_timing(self):
+        """
+        Значение заголовка Server-Timing (время в мс)
+        """
+        return ", ".join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'cache;desc="{self.cache_hits} hits, {self.cache_misses} misses"',
+            f"view;dur={self.latency * 1000:.1f}",
+        ])
+
+
+class CacheMetricsMixin:
+    """
+    Подсчет попаданий и промахов кеша в метрики текущего запроса
+    """
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.record_cache(value is not _MISSING, value is _MISSING)
+        return default if value is _MISSING else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = super().get_many(keys, version)
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.record_cache(len(values), len(keys) - len(values))
+        return values
+
+
+class InstrumentedRedisCache(CacheMetricsMixin, RedisCache):
+    pass
+
+
+class InstrumentedLocMemCache(CacheMetricsMixin, LocMemCache):
+    pass
+
+
+class URLStats:
+    """
+    Накопленные метрики запросов к одному URL (по имени маршрута)
+    """
+    # количество последних запросов для расчета перцентилей времени
+    SAMPLE_SIZE = 1000
+
+    def __init__(self):
+        self.count = 0
+        self.latency = 0.0
+        self.max_latency = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.duplicate_requests = 0  # запросы с повторяющимся SQL (N+1)
+        self.last_duplicate = ""
+        self.samples = deque(maxlen=self.SAMPLE_SIZE)
+
+    def add(self, metrics, duplicates):
+        self.count += 1
+        self.latency += metrics.latency
+        self.max_latency = max(self.max_latency, metrics.latency)
+        self.queries += metrics.queries
+        self.max_queries = max(self.max_queries, metrics.queries)
+        self.db_time += metrics.db_time
+        self.cache_hits += metrics.cache_hits
+        self.cache_misses += metrics.cache_misses
+        if duplicates:
+            self.duplicate_requests += 1
+            self.last_duplicate = max(duplicates, key=duplicates.get)
+        self.samples.append(metrics.latency)
+
+    def percentile(self, percent):
+        samples = sorted(self.samples)
+        index = min(len(samples) - 1, int(len(samples) * percent / 100))
+        return samples[index]
+
+    def as_dict(self):
+        """
+        Сводка в мс для вывода в JSON
+        """
+        return {
+            "count": self.count,
+            "avg_ms": round(self.latency / self.count * 1000, 1),
+            "p50_ms": round(self.percentile(50) * 1000, 1),
+            "p95_ms": round(self.percentile(95) * 1000, 1),
+            "max_ms": round(self.max_latency * 1000, 1),
+            "avg_queries": round(self.queries / self.count, 1),
+            "max_queries": self.max_queries,
+            "avg_db_ms": round(self.db_time / self.count * 1000, 1),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "duplicate_requests": self.duplicate_requests,
+            "last_duplicate": self.last_duplicate,
+        }
+
+
+class StatsRegistry:
+    """
+    Метрики запросов процесса, сгруппированные по имени маршрута
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def add(self, url_name, metrics, duplicates=None):
+        with self._lock:
+            self._stats.setdefault(url_name, URLStats()).add(metrics, duplicates)
+
+    def snapshot(self):
+        """
+        Сводка по маршрутам (самые долгие в сумме - первыми)
+        """
+        with self._lock:
+            items = sorted(self._stats.items(), key=lambda item: -item[1].latency)
+            return {url_name: stats.as_dict() for url_name, stats in items}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.started = time.time()
+
+
+registry = StatsRegistry()
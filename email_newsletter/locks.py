@@ -0,0 +1,78 @@
+import os
+import tempfile
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# ключ advisory-блокировки планировщика рассылок
+SCHEDULER_LOCK_KEY = 6_180_517
+
+
+class AdvisoryLock:
+    """
+    Межпроцессная блокировка без ожидания.
+    В PostgreSQL - сессионная advisory-блокировка на отдельном соединении с БД
+    (ее не закрывают ни пул обработчиков, ни сбросы соединений Django),
+    для других БД - блокировка файла во временном каталоге (в пределах одного сервера)
+    """
+
+    def __init__(self, name, key):
+        self.name = name
+        self.key = key
+        self._connection = None
+        self._file = None
+
+    def acquire(self):
+        """
+        Захват блокировки, False - если она уже занята другим процессом
+        """
+        if connections[DEFAULT_DB_ALIAS].vendor == "postgresql":
+            connection = connections.create_connection(DEFAULT_DB_ALIAS)
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_try_advisory_lock(%s)", [self.key])
+                acquired = cursor.fetchone()[0]
+            if acquired:
+                self._connection = connection
+            else:
+                connection.close()
+            return acquired
+
+        import fcntl
+
+        lock_file = open(os.path.join(tempfile.gettempdir(), f"{self.name}.lock"), "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._file = lock_file
+        return True
+
+    def is_held(self):
+        """
+        Блокировка еще наша: при обрыве соединения с БД PostgreSQL ее снимает
+        """
+        if self._connection is not None:
+            return self._connection.is_usable()
+        return self._file is not None
+
+    def release(self):
+        if self._connection is not None:
+            # закрытие сессии снимает advisory-блокировку
+            self._connection.close()
+            self._connection = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def scheduler_lock():
+    """
+    Блокировка, гарантирующая единственный работающий планировщик рассылок
+    """
+    return AdvisoryLock("email_newsletter_scheduler", SCHEDULER_LOCK_KEY)
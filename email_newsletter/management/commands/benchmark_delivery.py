@@ -0,0 +1,54 @@
+import time
+
+from django.core.management import BaseCommand
+from django.test.utils import override_settings
+
+from email_newsletter.async_delivery import AsyncMailDelivery
+from email_newsletter.delivery import ConnectionPool, MailDelivery
+from email_newsletter.ratelimit import RateLimiter
+from email_newsletter.smtp_sink import SMTPSink
+
+
+class Command(BaseCommand):
+    help = "Сравнение скорости обычной и asyncio-отправки на локальной SMTP-заглушке"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=500, help="количество писем")
+        parser.add_argument(
+            "--delay", type=float, default=0.01, help="задержка заглушки на каждое письмо, сек"
+        )
+        parser.add_argument("--concurrency", type=int, default=10)
+
+    def handle(self, *args, **options):
+        sink = SMTPSink(delay=options["delay"]).start()
+        recipients = [f"client{number}@example.com" for number in range(options["count"])]
+        # без ограничения скорости - замеряется сама отправка
+        rate_limiter = RateLimiter(0, 0, 0, {})
+        try:
+            with override_settings(
+                EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+                EMAIL_HOST="127.0.0.1",
+                EMAIL_PORT=sink.port,
+                EMAIL_USE_TLS=False,
+                EMAIL_USE_SSL=False,
+            ):
+                deliveries = (
+                    ("sync", MailDelivery(pool=ConnectionPool(), rate_limiter=rate_limiter)),
+                    (
+                        "async",
+                        AsyncMailDelivery(
+                            concurrency=options["concurrency"], rate_limiter=rate_limiter
+                        ),
+                    ),
+                )
+                for mode, delivery in deliveries:
+                    started = time.monotonic()
+                    results = list(delivery.send("Проверка", "Текст письма", recipients))
+                    elapsed = time.monotonic() - started
+                    sent = sum(result.is_sent for result in results)
+                    self.stdout.write(
+                        f"{mode}: отправлено {sent} из {len(results)} за {elapsed:.2f} с "
+                        f"({len(results) / elapsed:.0f} писем/с)"
+                    )
+        finally:
+            sink.stop()
@@ -0,0 +1,106 @@
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from email_newsletter.models import Attempt, Client, DeliveryStat, Newsletter
+from email_newsletter.services import get_report_deliveries
+from users.models import User
+
+
+def get_hot_queries(user, current_datetime):
+    """
+    Частые запросы сервиса: (название, queryset)
+    """
+    newsletter = Newsletter.objects.filter(owner=user).order_by("pk").first()
+    emails = list(Client.objects.filter(owner=user).values_list("email", flat=True)[:500])
+    return (
+        ("рассылки к отправке", Newsletter.objects.due(current_datetime)),
+        (
+            "список активных рассылок пользователя",
+            Newsletter.objects.filter(owner=user, is_active=True).order_by("pk")[:12],
+        ),
+        (
+            "последние попытки рассылки",
+            Attempt.objects.filter(newsletter=newsletter).order_by("-last_data")[:10],
+        ),
+        ("страница отчета", get_report_deliveries(user)[:50]),
+        ("итоги отчета", DeliveryStat.objects.filter(owner=user).order_by("day")),
+        (
+            "проверка повторов при загрузке клиентов",
+            Client.objects.filter(owner=user)
+            .annotate(email_key=Lower("email"))
+            .filter(email_key__in=[email.lower() for email in emails]),
+        ),
+    )
+
+
+class Command(BaseCommand):
+    help = "Планы и время частых запросов к БД (с --drop-indexes - еще и без индексов моделей)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--owner", default=None,
+            help="адрес почты пользователя (по умолчанию - владелец наибольшего числа клиентов)",
+        )
+        parser.add_argument("--repeat", type=int, default=5, help="повторов замера времени")
+        parser.add_argument(
+            "--drop-indexes", action="store_true",
+            help="замерить запросы и без индексов моделей: индексы удаляются в откатываемой "
+            "транзакции, но таблицы на это время блокируются - только при DEBUG (копия БД)",
+        )
+
+    def handle(self, *args, **options):
+        user = self.get_user(options["owner"])
+        current_datetime = timezone.now()
+        if options["drop_indexes"]:
+            if not settings.DEBUG:
+                # удаление индекса в PostgreSQL берет ACCESS EXCLUSIVE до конца транзакции
+                raise CommandError(
+                    "--drop-indexes блокирует таблицы рассылок, запускайте на копии БД с DEBUG=True"
+                )
+            if not connection.features.can_rollback_ddl:
+                raise CommandError("БД не поддерживает откат DDL, запустите без --drop-indexes")
+            # индексы удаляются внутри транзакции, которая затем откатывается
+            # (SQLite требует отключить проверку внешних ключей до начала транзакции)
+            with connection.constraint_checks_disabled(), transaction.atomic():
+                self.drop_model_indexes()
+                self.stdout.write(self.style.MIGRATE_HEADING("=== Без индексов моделей ==="))
+                self.report(user, current_datetime, options["repeat"])
+                transaction.set_rollback(True)
+        self.stdout.write(self.style.MIGRATE_HEADING("=== С индексами моделей ==="))
+        self.report(user, current_datetime, options["repeat"])
+
+    @staticmethod
+    def get_user(email):
+        if email:
+            try:
+                return User.objects.get(email=email)
+            except User.DoesNotExist:
+                raise CommandError(f"Пользователь {email} не найден")
+        user = User.objects.annotate(clients=Count("client")).order_by("-clients").first()
+        if user is None:
+            raise CommandError("В БД нет пользователей, сначала заполните ее данными")
+        return user
+
+    @staticmethod
+    def drop_model_indexes():
+        with connection.schema_editor() as schema_editor:
+            for model in apps.get_app_config("email_newsletter").get_models():
+                for index in model._meta.indexes:
+                    schema_editor.remove_index(model, index)
+
+    def report(self, user, current_datetime, repeat):
+        for title, queryset in get_hot_queries(user, current_datetime):
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append(time.perf_counter() - started)
+            self.stdout.write(self.style.SUCCESS(f"{title}: {min(timings) * 1000:.2f} мс"))
+            self.stdout.write(queryset.explain())
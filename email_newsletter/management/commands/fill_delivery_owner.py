@@ -0,0 +1,30 @@
+from django.core.management import BaseCommand
+from django.db.models import Max, Min, OuterRef, Subquery
+
+from email_newsletter.models import Delivery, Newsletter
+
+
+class Command(BaseCommand):
+    help = "Заполнение владельца у отправок клиентам, записанных до его появления"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=10000, help="отправок в одном UPDATE"
+        )
+
+    def handle(self, *args, **options):
+        """
+        Владелец берется из рассылки; журнал обновляется диапазонами pk,
+        чтобы не держать одну долгую транзакцию на всей таблице
+        """
+        batch_size = options["batch_size"]
+        deliveries = Delivery.objects.filter(owner__isnull=True, newsletter__owner__isnull=False)
+        bounds = deliveries.aggregate(first=Min("pk"), last=Max("pk"))
+        if bounds["first"] is None:
+            self.stdout.write("Обновлено отправок: 0")
+            return
+        owner = Subquery(Newsletter.objects.filter(pk=OuterRef("newsletter_id")).values("owner")[:1])
+        updated = 0
+        for start in range(bounds["first"], bounds["last"] + 1, batch_size):
+            updated += deliveries.filter(pk__gte=start, pk__lt=start + batch_size).update(owner=owner)
+        self.stdout.write(f"Обновлено отправок: {updated}")
@@ -0,0 +1,30 @@
+from django.core.management import BaseCommand
+from django.db.models import Max
+from django.utils import timezone
+
+from email_newsletter.models import Newsletter
+
+
+class Command(BaseCommand):
+    help = "Заполнение времени следующей отправки у рассылок, созданных до его появления"
+
+    def handle(self, *args, **options):
+        """
+        Созданные рассылки ждут время начала,
+        запущенные - следующий срок после последней попытки
+        """
+        newsletters = Newsletter.objects.filter(
+            next_run_at__isnull=True,
+            status__in=(Newsletter.CREATED, Newsletter.LAUNCHED),
+        ).annotate(last_attempt=Max("attempt__last_data"))
+        updated = []
+        for newsletter in newsletters.iterator():
+            if newsletter.status == Newsletter.CREATED:
+                newsletter.next_run_at = newsletter.start_data
+            else:
+                newsletter.next_run_at = newsletter.get_next_run_at(
+                    newsletter.last_attempt or timezone.now()
+                )
+            updated.append(newsletter)
+        Newsletter.objects.bulk_update(updated, ["next_run_at"], batch_size=500)
+        self.stdout.write(f"Обновлено рассылок: {len(updated)}")
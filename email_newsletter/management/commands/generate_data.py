@@ -0,0 +1,185 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery
+from django.utils import timezone
+
+from blog.models import Blog
+from email_newsletter.models import Attempt, Client, Delivery, Message, Newsletter
+from email_newsletter.services import clear_blog_cache, clear_homepage_stats
+from email_newsletter.stats import rebuild_delivery_stats
+from users.models import User
+
+
+class BulkInserter:
+    """
+    Накопление объектов и запись в БД пачками через bulk_create
+    """
+
+    def __init__(self, model, batch_size):
+        self.model = model
+        self.batch_size = batch_size
+        self.objects = []
+        self.count = 0
+
+    def add(self, obj):
+        self.objects.append(obj)
+        if len(self.objects) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.objects:
+            self.model.objects.bulk_create(self.objects)
+            self.count += len(self.objects)
+            self.objects = []
+
+
+class Command(BaseCommand):
+    help = "Заполнение БД синтетическими данными для замеров (пачками через bulk_create)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10)
+        parser.add_argument("--clients", type=int, default=1000, help="клиентов на пользователя")
+        parser.add_argument("--newsletters", type=int, default=10, help="рассылок на пользователя")
+        parser.add_argument(
+            "--recipients", type=int, default=500, help="клиентов в каждой рассылке"
+        )
+        parser.add_argument("--attempts", type=int, default=20, help="попыток на рассылку")
+        parser.add_argument(
+            "--deliveries", type=int, default=20, help="отправок клиентам на попытку"
+        )
+        parser.add_argument("--blogs", type=int, default=20)
+        parser.add_argument("--prefix", default="bench", help="префикс адресов пользователей")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=None, help="для повторяемых данных")
+
+    def handle(self, *args, **options):
+        prefix = options["prefix"]
+        if User.objects.filter(email__startswith=f"{prefix}-").exists():
+            raise CommandError(f"Данные с префиксом {prefix} уже есть, укажите другой --prefix")
+        rng = random.Random(options["seed"])
+        batch_size = options["batch_size"]
+        now = timezone.now()
+        with transaction.atomic():
+            # хеш пароля считается один раз: он медленный намеренно
+            password = make_password("bench-password")
+            users = User.objects.bulk_create(
+                User(email=f"{prefix}-user{number}@example.com", password=password)
+                for number in range(options["users"])
+            )
+            clients = BulkInserter(Client, batch_size)
+            for user in users:
+                for number in range(options["clients"]):
+                    clients.add(
+                        Client(
+                            name=f"Клиент {number}",
+                            email=f"{prefix}-{user.pk}-{number}@example.com",
+                            owner=user,
+                        )
+                    )
+            clients.flush()
+            client_rows = {}
+            for user in users:
+                client_rows[user.pk] = list(
+                    Client.objects.filter(owner=user).values_list("pk", "email")
+                )
+
+            messages = Message.objects.bulk_create(
+                (
+                    Message(subject=f"Тема {number}", body="Здравствуйте, {{ name }}!", owner=user)
+                    for user in users
+                    for number in range(options["newsletters"])
+                ),
+                batch_size=batch_size,
+            )
+            newsletters = []
+            for message in messages:
+                start_data = now - timedelta(days=rng.randint(1, 365))
+                newsletter = Newsletter(
+                    start_data=start_data,
+                    periodicity=rng.choice(list(Newsletter.PERIODICITY)),
+                    status=rng.choice((Newsletter.CREATED, Newsletter.LAUNCHED, Newsletter.COMPLETED)),
+                    message=message,
+                    owner_id=message.owner_id,
+                    is_active=rng.random() < 0.9,
+                )
+                # bulk_create не вызывает save(): время следующей отправки задаем сами
+                if newsletter.status == Newsletter.CREATED:
+                    newsletter.next_run_at = start_data
+                elif newsletter.status == Newsletter.LAUNCHED:
+                    newsletter.next_run_at = newsletter.get_next_run_at(now)
+                newsletters.append(newsletter)
+            Newsletter.objects.bulk_create(newsletters, batch_size=batch_size)
+
+            recipients = BulkInserter(Newsletter.client.through, batch_size)
+            attempts = BulkInserter(Attempt, batch_size)
+            newsletter_emails = {}
+            for newsletter in newsletters:
+                owner_clients = client_rows[newsletter.owner_id]
+                sample = rng.sample(owner_clients, min(options["recipients"], len(owner_clients)))
+                newsletter_emails[newsletter.pk] = [email for client_pk, email in sample]
+                for client_pk, email in sample:
+                    recipients.add(
+                        Newsletter.client.through(newsletter_id=newsletter.pk, client_id=client_pk)
+                    )
+                for number in range(options["attempts"]):
+                    attempts.add(
+                        Attempt(
+                            last_data=now - timedelta(hours=rng.randint(1, 24 * 365)),
+                            status=Attempt.SENT,
+                            newsletter=newsletter,
+                        )
+                    )
+            recipients.flush()
+            attempts.flush()
+
+            deliveries = BulkInserter(Delivery, batch_size)
+            last_delivery_pk = Delivery.objects.aggregate(pk=Max("pk"))["pk"] or 0
+            for attempt in Attempt.objects.filter(newsletter__in=newsletters).iterator():
+                emails = newsletter_emails[attempt.newsletter_id]
+                for email in rng.sample(emails, min(options["deliveries"], len(emails))):
+                    is_sent = rng.random() < 0.95
+                    deliveries.add(
+                        Delivery(
+                            attempt=attempt,
+                            newsletter_id=attempt.newsletter_id,
+                            email=email,
+                            status=Attempt.SENT if is_sent else Attempt.NOT_SENT,
+                            code=250 if is_sent else 550,
+                            answer=None if is_sent else "5.1.1 Mailbox unavailable",
+                            latency=rng.uniform(0.01, 0.5),
+                        )
+                    )
+            deliveries.flush()
+            # время отправки в журнале - время попытки (auto_now_add ставит текущее),
+            # владелец - владелец рассылки
+            Delivery.objects.filter(pk__gt=last_delivery_pk).update(
+                created_at=Subquery(
+                    Attempt.objects.filter(pk=OuterRef("attempt_id")).values("last_data")[:1]
+                ),
+                owner=Subquery(
+                    Newsletter.objects.filter(pk=OuterRef("newsletter_id")).values("owner")[:1]
+                ),
+            )
+
+            # главная страница выводит превью статей - используем картинку из репозитория
+            Blog.objects.bulk_create(
+                Blog(
+                    title=f"Статья {number}",
+                    content="Текст статьи " * 50,
+                    preview="preview/advertising.jpg",
+                )
+                for number in range(options["blogs"])
+            )
+        stats = rebuild_delivery_stats()
+        clear_homepage_stats()
+        clear_blog_cache()
+        self.stdout.write(
+            f"Пользователей: {len(users)}, клиентов: {clients.count}, рассылок: {len(newsletters)}, "
+            f"получателей в рассылках: {recipients.count}, попыток: {attempts.count}, "
+            f"отправок клиентам: {deliveries.count}, статей: {options['blogs']}, "
+            f"строк статистики: {stats}"
+        )
@@ -0,0 +1,36 @@
+from django.core.management import BaseCommand, CommandError
+
+from email_newsletter.imports import get_import_format, import_clients, iter_rows
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Загрузка клиентов пользователя из CSV/JSON-файла"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="файл .csv, .json или .jsonl")
+        parser.add_argument("--owner", required=True, help="адрес почты владельца клиентов")
+        parser.add_argument(
+            "--format", choices=("csv", "json", "jsonl"), default=None,
+            help="формат файла (по умолчанию - по расширению)",
+        )
+        parser.add_argument("--batch-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        import_format = options["format"] or get_import_format(options["path"])
+        if import_format is None:
+            raise CommandError("Не удалось определить формат файла, укажите --format")
+        try:
+            owner = User.objects.get(email=options["owner"])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {options['owner']} не найден")
+        with open(options["path"], "rb") as file:
+            result = import_clients(owner, iter_rows(file, import_format), options["batch_size"])
+        self.stdout.write(
+            f"Добавлено клиентов: {result.created}, пропущено повторов: {result.duplicates}, "
+            f"с ошибками: {result.invalid}"
+        )
+        for error in result.errors:
+            self.stdout.write(error)
+        if result.error:
+            raise CommandError(f"Файл прочитан не полностью: {result.error}")
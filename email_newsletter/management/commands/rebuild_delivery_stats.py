@@ -0,0 +1,11 @@
+from django.core.management import BaseCommand
+
+from email_newsletter.stats import rebuild_delivery_stats
+
+
+class Command(BaseCommand):
+    help = "Пересчет статистики отправки рассылок по журналу отправок клиентам"
+
+    def handle(self, *args, **options):
+        count = rebuild_delivery_stats()
+        self.stdout.write(f"Записей статистики: {count}")
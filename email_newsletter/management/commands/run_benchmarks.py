@@ -0,0 +1,170 @@
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client as TestClient
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from email_newsletter.cron import my_scheduled_job
+from email_newsletter.delivery import get_connection_pool
+from email_newsletter.models import Newsletter
+from email_newsletter.ratelimit import reset_rate_limiter
+from email_newsletter.services import clear_blog_cache, clear_homepage_stats
+from email_newsletter.smtp_sink import SMTPSink
+from users.models import User
+
+# страницы для замера: (название, имя URL)
+PAGES = (
+    ("mailing_report", "email_newsletter:mailing_report"),
+    ("newsletter_list", "email_newsletter:newsletter"),
+    ("client_list", "email_newsletter:client"),
+    ("message_list", "email_newsletter:message"),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Замер времени и количества запросов к БД: рассылка (на локальной SMTP-заглушке), "
+        "главная, отчет и списки; сравнение с сохраненными результатами"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--owner", default=None,
+            help="адрес почты пользователя (по умолчанию - владелец наибольшего числа рассылок)",
+        )
+        parser.add_argument("--repeat", type=int, default=3, help="повторов каждого замера")
+        parser.add_argument("--save", default=None, help="сохранить результаты в JSON-файл")
+        parser.add_argument("--baseline", default=None, help="JSON-файл прошлых результатов")
+        parser.add_argument(
+            "--tolerance", type=float, default=0.5,
+            help="допустимый рост времени относительно прошлых результатов (0.5 - на 50%%)",
+        )
+
+    def handle(self, *args, **options):
+        user = self.get_user(options["owner"])
+        sink = SMTPSink().start()
+        try:
+            with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+                EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+                EMAIL_HOST="127.0.0.1",
+                EMAIL_PORT=sink.port,
+                EMAIL_USE_TLS=False,
+                EMAIL_USE_SSL=False,
+                EMAIL_RATE_LIMIT=0,
+                EMAIL_SENDER_RATE_LIMIT=0,
+                EMAIL_DOMAIN_RATE_LIMIT=0,
+                EMAIL_DOMAIN_RATE_LIMITS={},
+                # рассылки обрабатываются в этом соединении - их изменения откатываются
+                NEWSLETTER_WORKERS=1,
+            ):
+                reset_rate_limiter()
+                results = self.run_benchmarks(user, options["repeat"])
+        finally:
+            get_connection_pool().close()
+            reset_rate_limiter()
+            sink.stop()
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name}: {result['time_ms']:.1f} мс, запросов к БД: {result['queries']}"
+            )
+        if options["save"]:
+            with open(options["save"], "w") as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+        if options["baseline"]:
+            self.compare(results, options["baseline"], options["tolerance"])
+
+    @staticmethod
+    def get_user(email):
+        if email:
+            try:
+                return User.objects.get(email=email)
+            except User.DoesNotExist:
+                raise CommandError(f"Пользователь {email} не найден")
+        user = User.objects.annotate(newsletters=Count("newsletter")).order_by("-newsletters").first()
+        if user is None:
+            raise CommandError("В БД нет пользователей, сначала выполните generate_data")
+        return user
+
+    @staticmethod
+    def measure(action, repeat):
+        """
+        Лучшее время из repeat запусков и количество запросов к БД
+        """
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                action()
+                timings.append(time.perf_counter() - started)
+        return {"time_ms": round(min(timings) * 1000, 2), "queries": len(queries)}
+
+    def run_benchmarks(self, user, repeat):
+        results = {}
+
+        def scheduled_job():
+            # все рассылки пользователя к отправке; изменения в БД откатываются
+            with transaction.atomic():
+                Newsletter.objects.filter(owner=user).update(
+                    status=Newsletter.LAUNCHED,
+                    is_active=True,
+                    end_data=None,
+                    next_run_at=timezone.now() - timedelta(minutes=1),
+                    locked_until=None,
+                )
+                my_scheduled_job()
+                transaction.set_rollback(True)
+
+        results["my_scheduled_job"] = self.measure(scheduled_job, repeat)
+
+        client = TestClient()
+        client.force_login(user)
+
+        def get_page(url, clear_cache=False):
+            def action():
+                if clear_cache:
+                    clear_homepage_stats()
+                    clear_blog_cache()
+                response = client.get(url)
+                if response.status_code != 200:
+                    raise CommandError(f"{url}: код ответа {response.status_code}")
+            return action
+
+        results["homepage"] = self.measure(
+            get_page(reverse("email_newsletter:homepage"), clear_cache=True), repeat
+        )
+        for name, url_name in PAGES:
+            results[name] = self.measure(get_page(reverse(url_name)), repeat)
+        return results
+
+    def compare(self, results, baseline_path, tolerance):
+        """
+        Ошибка, если запросов стало больше или время выросло больше допустимого
+        """
+        with open(baseline_path) as file:
+            baseline = json.load(file)
+        regressions = []
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            previous = baseline[name]
+            if result["queries"] > previous["queries"]:
+                regressions.append(
+                    f"{name}: запросов {result['queries']} (было {previous['queries']})"
+                )
+            # 5 мс - запас на погрешность замера быстрых операций
+            if result["time_ms"] > previous["time_ms"] * (1 + tolerance) + 5:
+                regressions.append(
+                    f"{name}: {result['time_ms']:.1f} мс (было {previous['time_ms']:.1f} мс)"
+                )
+        if regressions:
+            raise CommandError("Ухудшение производительности:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("Ухудшений относительно прошлых результатов нет"))
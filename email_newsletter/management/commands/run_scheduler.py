@@ -0,0 +1,44 @@
+import logging
+import signal
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from email_newsletter.locks import scheduler_lock
+from email_newsletter.scheduler import Scheduler
+
+
+class Command(BaseCommand):
+    help = "Постоянно работающий планировщик рассылок (вместо задания crontab)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-sleep", type=float, default=None,
+            help="наибольшая пауза между проверками новых рассылок, сек",
+        )
+        parser.add_argument(
+            "--without-outbox", action="store_true",
+            help="не отправлять очередь исходящих писем (ее отправляет send_outbox)",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Запуск до сигнала SIGTERM/SIGINT: текущий проход завершается, затем выход
+        """
+        if options["verbosity"] > 1:
+            logging.basicConfig(level=logging.INFO)
+        scheduler = Scheduler(options["max_sleep"], not options["without_outbox"])
+        lock = None
+        if settings.SCHEDULER_SINGLE_INSTANCE:
+            lock = scheduler_lock()
+            if not lock.acquire():
+                raise CommandError("Планировщик рассылок уже запущен")
+        signal.signal(signal.SIGTERM, scheduler.stop)
+        signal.signal(signal.SIGINT, scheduler.stop)
+        self.stdout.write("Планировщик рассылок запущен")
+        try:
+            scheduler.run(lock)
+        finally:
+            if lock is not None:
+                lock.release()
+        self.stdout.write("Планировщик рассылок остановлен")
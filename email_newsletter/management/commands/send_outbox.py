@@ -0,0 +1,35 @@
+import time
+
+from django.core.management import BaseCommand
+
+from email_newsletter.outbox import drain_outbox
+
+
+class Command(BaseCommand):
+    help = "Отправка писем из очереди исходящих писем"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument(
+            "--loop", action="store_true", help="работать постоянно, проверяя очередь"
+        )
+        parser.add_argument(
+            "--interval", type=float, default=5.0, help="пауза при пустой очереди, сек"
+        )
+
+    def handle(self, *args, **options):
+        """
+        Отправка пачками, пока очередь не опустеет (с --loop - до прерывания)
+        """
+        total = 0
+        try:
+            while True:
+                processed = drain_outbox(options["batch_size"])
+                total += processed
+                if not processed:
+                    if not options["loop"]:
+                        break
+                    time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f"Обработано писем: {total}")
@@ -0,0 +1,34 @@
+from django.core.management import BaseCommand
+
+from email_newsletter.smtp_sink import SMTPSink
+
+
+class Command(BaseCommand):
+    help = "Локальный SMTP-сервер-заглушка для проверки отправки рассылок"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=1025)
+        parser.add_argument(
+            "--delay", type=float, default=0.0, help="задержка ответа на каждое письмо, сек"
+        )
+        parser.add_argument(
+            "--max-messages", type=int, default=0,
+            help="писем за одну сессию, после чего сервер разрывает соединение (0 - без ограничения)",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Запуск сервера до прерывания (Ctrl+C)
+        """
+        sink = SMTPSink(
+            options["host"], options["port"], options["delay"], options["max_messages"]
+        )
+        self.stdout.write(f"SMTP-заглушка слушает {options['host']}:{sink.port}")
+        try:
+            sink.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sink.server_close()
+            self.stdout.write(f"Сессий: {sink.sessions}, писем: {sink.messages}")
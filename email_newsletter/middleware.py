@@ -0,0 +1,54 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from email_newsletter.instrumentation import RequestMetrics, current_metrics, registry
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetricsMiddleware:
+    """
+    Замер каждого запроса: количество и время SQL-запросов, попадания и промахи кеша,
+    время обработки. Метрики копятся по имени маршрута (страница статистики для персонала)
+    и отдаются в заголовке Server-Timing - только персоналу, чтобы посторонние не видели
+    устройство запросов к БД (при DEBUG - всем). При INSTRUMENTATION_DUPLICATE_QUERIES
+    повторяющиеся SQL-запросы (N+1) пишутся в лог
+    """
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTATION_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.track_duplicates = settings.INSTRUMENTATION_DUPLICATE_QUERIES
+        self.duplicate_threshold = settings.INSTRUMENTATION_DUPLICATE_THRESHOLD
+
+    def __call__(self, request):
+        metrics = RequestMetrics(track_duplicates=self.track_duplicates)
+        token = current_metrics.set(metrics)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(metrics.execute_wrapper))
+                response = self.get_response(request)
+        finally:
+            metrics.latency = time.perf_counter() - started
+            current_metrics.reset(token)
+
+        match = request.resolver_match
+        url_name = match.view_name if match and match.view_name else "<unresolved>"
+        duplicates = metrics.get_duplicates(self.duplicate_threshold)
+        for sql, count in duplicates.items():
+            logger.warning(
+                "Повторяющийся SQL-запрос (%s раз) на %s %s: %s", count, url_name, request.path, sql
+            )
+        registry.add(url_name, metrics, duplicates)
+        user = getattr(request, "user", None)
+        if settings.DEBUG or (user is not None and user.is_staff):
+            response["Server-Timing"] = metrics.server_timing()
+        return response
@@ -1,5 +1,11 @@
-from django.db import models
+from datetime import timedelta
 
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from email_newsletter.func import add_months, success_rate
 from users.models import User
 
 NULLABLE = {"blank": True, "null": True}
@@ -27,6 +33,10 @@ class Client(models.Model):
     class Meta:
         verbose_name = "клиент"  # Настройка для наименования одного объекта
         verbose_name_plural = "клиенты"  # Настройка для наименования набора объектов
+        indexes = [
+            # поиск клиентов владельца по адресу без учета регистра (загрузка из файла)
+            models.Index(F("owner"), Lower("email"), name="client_owner_email_idx"),
+        ]
 
 
 class Message(models.Model):
@@ -52,6 +62,74 @@ class Message(models.Model):
         verbose_name_plural = "сообщения"  # Настройка для наименования набора объектов
 
 
+class NewsletterQuerySet(models.QuerySet):
+    """
+    Выборки рассылок для планировщика
+    """
+
+    def finish_expired(self, current_datetime):
+        """
+        Завершение рассылок, время которых истекло, одним UPDATE
+        """
+        return self.filter(
+            is_active=True,
+            status__in=(Newsletter.CREATED, Newsletter.LAUNCHED),
+            end_data__lt=current_datetime,
+        ).update(status=Newsletter.COMPLETED)
+
+    def scheduled(self, current_datetime):
+        """
+        Активные рассылки, у которых еще будут отправки
+        """
+        return self.filter(
+            Q(end_data__isnull=True) | Q(end_data__gt=current_datetime),
+            next_run_at__isnull=False,
+            is_active=True,
+            status__in=(Newsletter.CREATED, Newsletter.LAUNCHED),
+        )
+
+    def due(self, current_datetime):
+        """
+        Рассылки, время очередной отправки которых наступило
+        (выборка по индексу next_run_at)
+        """
+        return self.scheduled(current_datetime).filter(next_run_at__lte=current_datetime)
+
+    def not_locked(self, current_datetime):
+        """
+        Рассылки, не захваченные планировщиком (или аренда которых истекла)
+        """
+        return self.filter(Q(locked_until__isnull=True) | Q(locked_until__lte=current_datetime))
+
+    def claim_due(self, current_datetime, worker, lease, limit=None):
+        """
+        Захват рассылок, время отправки которых наступило. Строки блокируются
+        без ожидания (skip_locked), захваченные получают аренду до locked_until:
+        несколько планировщиков делят рассылки и не отправляют одну дважды
+        """
+        with transaction.atomic():
+            newsletter_pks = list(
+                self.due(current_datetime)
+                .not_locked(current_datetime)
+                .select_for_update(skip_locked=True)
+                .order_by("next_run_at")
+                .values_list("pk", flat=True)[:limit]
+            )
+            self.filter(pk__in=newsletter_pks).update(
+                locked_until=current_datetime + timedelta(seconds=lease), locked_by=worker
+            )
+        return newsletter_pks
+
+    def extend_lease(self, current_datetime, worker, lease):
+        """
+        Продление аренды рассылок, захваченных обработчиком worker, одним UPDATE;
+        возвращает количество продленных (0 - аренду перехватил другой обработчик)
+        """
+        return self.filter(locked_by=worker).update(
+            locked_until=current_datetime + timedelta(seconds=lease)
+        )
+
+
 class Newsletter(models.Model):
     """
     Рассылка сообщений
@@ -105,11 +183,64 @@ class Newsletter(models.Model):
         **NULLABLE,
     )
     is_active = models.BooleanField(default=True, verbose_name="Статус активности")
+    next_run_at = models.DateTimeField(verbose_name="Время следующей отправки", **NULLABLE)
+    # аренда рассылки планировщиком на время отправки
+    locked_until = models.DateTimeField(verbose_name="Захвачена до", **NULLABLE)
+    locked_by = models.CharField(max_length=100, verbose_name="Захвачена обработчиком", **NULLABLE)
+
+    objects = NewsletterQuerySet.as_manager()
 
     def __str__(self):
         # Строковое отображение объекта
         return f"дата:{self.start_data}, периодичность: {self.periodicity}, статус: {self.status}, {self.message}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # расписание на момент загрузки (при его изменении пересчитывается next_run_at)
+        instance._loaded_schedule = instance._get_schedule()
+        return instance
+
+    def _get_schedule(self):
+        return self.__dict__.get("start_data"), self.__dict__.get("periodicity")
+
+    def save(self, *args, **kwargs):
+        next_run_at = self.next_run_at
+        if self.status == self.CREATED:
+            # до первой отправки рассылка ждет время начала
+            self.next_run_at = self.start_data
+        elif self.status == self.LAUNCHED and (
+            getattr(self, "_loaded_schedule", None) != self._get_schedule()
+        ):
+            # у запущенной рассылки изменили время начала или периодичность
+            self.next_run_at = self.get_next_run_at(timezone.now())
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and self.next_run_at != next_run_at:
+            kwargs["update_fields"] = {*update_fields, "next_run_at"}
+        super().save(*args, **kwargs)
+        self._loaded_schedule = self._get_schedule()
+
+    def get_next_run_at(self, current_datetime):
+        """
+        Ближайшее после current_datetime время отправки по периодичности,
+        отсчитывая от времени начала рассылки (для разовой - None).
+        Месяцы считаются в местном времени (TIME_ZONE), а не в UTC из БД
+        """
+        if self.periodicity == self.ONE_TIME:
+            return None
+        start = timezone.localtime(self.start_data)
+        current_datetime = timezone.localtime(current_datetime)
+        if start > current_datetime:
+            return start
+        if self.periodicity == self.ONCE_A_MONTH:
+            months = (current_datetime.year - start.year) * 12 + current_datetime.month - start.month
+            next_run_at = add_months(start, months)
+            if next_run_at <= current_datetime:
+                next_run_at = add_months(start, months + 1)
+            return next_run_at
+        period = timedelta(days=1) if self.periodicity == self.ONCE_A_DAY else timedelta(weeks=1)
+        return start + ((current_datetime - start) // period + 1) * period
+
     class Meta:
         verbose_name = "рассылка"  # Настройка для наименования одного объекта
         verbose_name_plural = "рассылки"  # Настройка для наименования набора объектов
@@ -117,6 +248,20 @@ class Newsletter(models.Model):
             # может отключать рассылки
             ("cancel_active_status", "Can disable mailings"),
         ]
+        indexes = [
+            # выбор планировщиком: только активные рассылки в статусах "создана"/"запущена"
+            models.Index(
+                fields=["next_run_at"],
+                name="newsletter_due_idx",
+                condition=Q(is_active=True, status__in=["создана", "запущена"]),
+            ),
+            # список активных рассылок пользователя и счетчик на главной
+            models.Index(
+                fields=["owner"],
+                name="newsletter_owner_active_idx",
+                condition=Q(is_active=True),
+            ),
+        ]
 
 
 class Attempt(models.Model):
@@ -133,9 +278,7 @@ class Attempt(models.Model):
     status = models.CharField(
         choices=STATUS, verbose_name="Статус", default=False
     )  # успешно/не успешно
-    answer = models.CharField(
-        max_length=50, verbose_name="Ответ почтового сервера", **NULLABLE
-    )
+    answer = models.TextField(verbose_name="Ответ почтового сервера", **NULLABLE)
     # answer = models.BooleanField(default=False, verbose_name='Ответ почтового сервера')
     newsletter = models.ForeignKey(
         Newsletter,
@@ -154,3 +297,199 @@ class Attempt(models.Model):
     class Meta:
         verbose_name = "попытка"  # Настройка для наименования одного объекта
         verbose_name_plural = "попытки"  # Настройка для наименования набора объектов
+        indexes = [
+            # последние попытки рассылки
+            models.Index(fields=["newsletter", "-last_data"], name="attempt_newsletter_last_idx"),
+        ]
+
+
+class Delivery(models.Model):
+    """
+    Отправка сообщения одному клиенту в рамках попытки рассылки
+    """
+    attempt = models.ForeignKey(
+        Attempt,
+        related_name="delivery",
+        on_delete=models.CASCADE,
+        verbose_name="попытка",
+    )
+    newsletter = models.ForeignKey(
+        Newsletter,
+        related_name="delivery",
+        on_delete=models.CASCADE,
+        verbose_name="рассылка",
+    )
+    # владелец рассылки (копия для отчета: выборка по индексу без соединения с рассылками)
+    owner = models.ForeignKey(
+        User,
+        related_name="delivery",
+        verbose_name="владелец",
+        on_delete=models.SET_NULL,
+        **NULLABLE,
+    )
+    email = models.EmailField(verbose_name="Адрес получателя")
+    status = models.CharField(choices=Attempt.STATUS, max_length=15, verbose_name="Статус")
+    code = models.PositiveSmallIntegerField(
+        verbose_name="Код ответа почтового сервера", **NULLABLE
+    )
+    answer = models.TextField(verbose_name="Ответ почтового сервера", **NULLABLE)
+    latency = models.FloatField(default=0, verbose_name="Время отправки, сек")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="время/дата отправки")
+
+    def __str__(self):
+        # Строковое отображение объекта
+        return f"{self.email}: {self.status} ({self.code}) {self.answer or ''}"
+
+    class Meta:
+        verbose_name = "отправка клиенту"  # Настройка для наименования одного объекта
+        verbose_name_plural = "отправки клиентам"  # Настройка для наименования набора объектов
+        indexes = [
+            # отчет по рассылкам за период, пересчет статистики
+            models.Index(fields=["newsletter", "created_at"], name="delivery_newsletter_date_idx"),
+            # страницы отчета пользователя (новые сверху, постранично по ключу)
+            models.Index(fields=["owner", "-created_at", "-id"], name="delivery_owner_date_idx"),
+        ]
+
+
+class DeliveryRetry(models.Model):
+    """
+    Повторная отправка сообщения рассылки клиенту после временной ошибки
+    """
+    newsletter = models.ForeignKey(
+        Newsletter,
+        related_name="delivery_retry",
+        on_delete=models.CASCADE,
+        verbose_name="рассылка",
+    )
+    email = models.EmailField(verbose_name="Адрес получателя")
+    attempts = models.PositiveSmallIntegerField(default=1, verbose_name="Неудачных попыток")
+    next_try_at = models.DateTimeField(db_index=True, verbose_name="Время следующей попытки")
+    last_error = models.TextField(verbose_name="Последняя ошибка", **NULLABLE)
+
+    def __str__(self):
+        # Строковое отображение объекта
+        return f"{self.email}: попыток {self.attempts}, следующая {self.next_try_at}"
+
+    class Meta:
+        verbose_name = "повтор отправки"  # Настройка для наименования одного объекта
+        verbose_name_plural = "повторы отправки"  # Настройка для наименования набора объектов
+        constraints = [
+            models.UniqueConstraint(fields=["newsletter", "email"], name="unique_newsletter_retry"),
+        ]
+
+
+class DeliveryStat(models.Model):
+    """
+    Статистика отправки сообщений по рассылке за день
+    """
+    owner = models.ForeignKey(
+        User,
+        related_name="delivery_stat",
+        verbose_name="владелец",
+        on_delete=models.SET_NULL,
+        **NULLABLE,
+    )
+    newsletter = models.ForeignKey(
+        Newsletter,
+        related_name="delivery_stat",
+        on_delete=models.CASCADE,
+        verbose_name="рассылка",
+    )
+    # день начала попытки рассылки (Attempt.last_data)
+    day = models.DateField(verbose_name="день")
+    sent = models.PositiveIntegerField(default=0, verbose_name="отправлено")
+    failed = models.PositiveIntegerField(default=0, verbose_name="не отправлено")
+
+    def __str__(self):
+        # Строковое отображение объекта
+        return f"{self.day}: отправлено {self.sent}, не отправлено {self.failed}"
+
+    @property
+    def success_rate(self):
+        """
+        Процент успешно отправленных сообщений
+        """
+        return success_rate(self.sent, self.failed)
+
+    class Meta:
+        verbose_name = "статистика отправки"  # Настройка для наименования одного объекта
+        verbose_name_plural = "статистика отправки"  # Настройка для наименования набора объектов
+        constraints = [
+            models.UniqueConstraint(fields=["newsletter", "day"], name="unique_newsletter_day_stat"),
+        ]
+        indexes = [
+            # итоги отправки пользователя за период
+            models.Index(fields=["owner", "day"], name="delivery_stat_owner_day_idx"),
+        ]
+
+
+class OutgoingEmail(models.Model):
+    """
+    Служебное письмо пользователю в очереди на отправку
+    """
+    PENDING = "в очереди"
+    SENT = "отправлено"
+    FAILED = "не отправлено"
+    STATUS = {
+        PENDING: "в очереди",
+        SENT: "отправлено",
+        FAILED: "не отправлено",
+    }
+    subject = models.CharField(max_length=255, verbose_name="Тема письма")
+    body = models.TextField(verbose_name="Текст письма")
+    recipient = models.EmailField(verbose_name="Адрес получателя")
+    status = models.CharField(
+        choices=STATUS, max_length=15, verbose_name="Статус", default=PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Попыток отправки")
+    next_try_at = models.DateTimeField(default=timezone.now, verbose_name="Время следующей попытки")
+    last_error = models.TextField(verbose_name="Последняя ошибка", **NULLABLE)
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Время постановки в очередь")
+    sent_at = models.DateTimeField(verbose_name="Время отправки", **NULLABLE)
+
+    def __str__(self):
+        # Строковое отображение объекта
+        return f"{self.recipient}: {self.subject} ({self.status})"
+
+    class Meta:
+        verbose_name = "исходящее письмо"  # Настройка для наименования одного объекта
+        verbose_name_plural = "исходящие письма"  # Настройка для наименования набора объектов
+        indexes = [
+            # выбор писем для отправки: только ожидающие в очереди
+            models.Index(
+                fields=["next_try_at"],
+                name="outgoing_email_pending_idx",
+                condition=Q(status="в очереди"),
+            ),
+        ]
+
+
+class Suppression(models.Model):
+    """
+    Адрес, на который рассылки не отправляются (жесткий отказ почтового сервера, отписка)
+    """
+    BOUNCE = "отказ"
+    UNSUBSCRIBE = "отписка"
+    REASON = {
+        BOUNCE: "отказ почтового сервера",
+        UNSUBSCRIBE: "отписка",
+    }
+    email = models.EmailField(unique=True, verbose_name="Адрес электронной почты")
+    reason = models.CharField(
+        choices=REASON, max_length=15, verbose_name="Причина", default=UNSUBSCRIBE
+    )
+    answer = models.TextField(verbose_name="Ответ почтового сервера", **NULLABLE)
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Время добавления")
+
+    def __str__(self):
+        # Строковое отображение объекта
+        return f"{self.email} ({self.reason})"
+
+    def save(self, *args, **kwargs):
+        # адреса хранятся в нижнем регистре - проверка идет по индексу без lower()
+        self.email = self.email.lower()
+        super().save(*args, **kwargs)
+
+    class Meta:
+        verbose_name = "исключенный адрес"  # Настройка для наименования одного объекта
+        verbose_name_plural = "исключенные адреса"  # Настройка для наименования набора объектов
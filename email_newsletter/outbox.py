@@ -0,0 +1,81 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import transaction
+from django.utils import timezone
+
+from email_newsletter.delivery import MailDelivery
+from email_newsletter.func import backoff_delay
+from email_newsletter.models import OutgoingEmail
+
+
+def enqueue_mail(subject, message, recipient):
+    """
+    Постановка служебного письма в очередь (отправит drain_outbox)
+    """
+    return OutgoingEmail.objects.create(subject=subject, body=message, recipient=recipient)
+
+
+def claim_outbox(batch_size):
+    """
+    Выбор писем, время отправки которых наступило; выбранные письма
+    откладываются на OUTBOX_LEASE секунд, чтобы параллельный запуск их не взял
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutgoingEmail.PENDING, next_try_at__lte=now)
+            .order_by("next_try_at")[:batch_size]
+        )
+        OutgoingEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+            next_try_at=now + timedelta(seconds=settings.OUTBOX_LEASE)
+        )
+    return emails
+
+
+def drain_outbox(batch_size=None):
+    """
+    Отправка пачки писем из очереди через общее SMTP-соединение;
+    неудачные повторяются с экспоненциальной задержкой,
+    после OUTBOX_MAX_ATTEMPTS попыток письмо помечается как не отправленное.
+    У отправленных и не отправленных писем текст стирается.
+    Возвращает количество обработанных писем
+    """
+    emails = claim_outbox(batch_size or settings.OUTBOX_BATCH_SIZE)
+    if not emails:
+        return 0
+    messages = (
+        EmailMessage(
+            subject=email.subject,
+            body=email.body,
+            from_email=settings.EMAIL_HOST_USER,
+            to=[email.recipient],
+        )
+        for email in emails
+    )
+    results = list(MailDelivery().send_messages(messages))
+    now = timezone.now()
+    for email, result in zip(emails, results):
+        if result.is_sent:
+            email.status = OutgoingEmail.SENT
+            email.sent_at = now
+            email.last_error = None
+            # текст служебного письма (ссылки подтверждения и смены пароля) не храним
+            email.body = ""
+            continue
+        email.attempts += 1
+        email.last_error = result.answer
+        if email.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            email.status = OutgoingEmail.FAILED
+            email.body = ""
+        else:
+            delay = backoff_delay(
+                email.attempts, settings.OUTBOX_RETRY_DELAY, settings.OUTBOX_MAX_RETRY_DELAY
+            )
+            email.next_try_at = now + timedelta(seconds=delay)
+    OutgoingEmail.objects.bulk_update(
+        emails, ["status", "sent_at", "attempts", "last_error", "next_try_at", "body"]
+    )
+    return len(emails)
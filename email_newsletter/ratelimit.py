@@ -0,0 +1,99 @@
+import threading
+import time
+
+from django.conf import settings
+
+
+class TokenBucket:
+    """
+    Ведро токенов: rate писем в секунду в среднем, не более capacity подряд
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Берет токен (при необходимости - в долг), возвращает время ожидания
+        до момента, когда письмо можно отправить, сек
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return max(-self.tokens / self.rate, 0.0)
+
+
+class RateLimiter:
+    """
+    Ограничение скорости отправки: общий лимит, лимит на почтовый ящик
+    отправителя и на домен получателя (писем в секунду, 0 - без ограничения)
+    """
+
+    def __init__(self, global_rate=None, sender_rate=None, domain_rate=None, domain_rates=None):
+        global_rate = settings.EMAIL_RATE_LIMIT if global_rate is None else global_rate
+        self.sender_rate = settings.EMAIL_SENDER_RATE_LIMIT if sender_rate is None else sender_rate
+        self.domain_rate = settings.EMAIL_DOMAIN_RATE_LIMIT if domain_rate is None else domain_rate
+        # отдельные лимиты для доменов, например {"gmail.com": 5}
+        self.domain_rates = (
+            settings.EMAIL_DOMAIN_RATE_LIMITS if domain_rates is None else domain_rates
+        )
+        self.global_bucket = TokenBucket(global_rate) if global_rate else None
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, key, rate):
+        if not rate:
+            return None
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(rate)
+            return self._buckets[key]
+
+    def reserve(self, sender, recipient):
+        """
+        Резервирует отправку письма, возвращает необходимую паузу, сек
+        """
+        domain = recipient.rpartition("@")[2].lower()
+        buckets = (
+            self.global_bucket,
+            self._bucket(("sender", sender), self.sender_rate),
+            self._bucket(("domain", domain), self.domain_rates.get(domain, self.domain_rate)),
+        )
+        return max((bucket.reserve() for bucket in buckets if bucket is not None), default=0.0)
+
+    def wait(self, sender, recipient):
+        """
+        Пауза до момента, когда письмо можно отправить
+        """
+        delay = self.reserve(sender, recipient)
+        if delay:
+            time.sleep(delay)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """
+    Общий для процесса ограничитель скорости (лимиты действуют в пределах процесса)
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
+
+
+def reset_rate_limiter():
+    """
+    Сброс ограничителя - для дочернего процесса после fork
+    """
+    global _limiter
+    _limiter = None
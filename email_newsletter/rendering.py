@@ -0,0 +1,99 @@
+import re
+from email.utils import make_msgid
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.core.mail.message import forbid_multi_line_headers
+from django.core.mail.utils import DNS_NAME
+
+# подстановки данных клиента в тексте сообщения: {{ name }}, {{ email }}.
+# Шаблонизатор Django не используется: теги ({% url %}, {% include %}) в тексте
+# пользователя могли бы упасть при отрисовке и сорвать всю рассылку
+PLACEHOLDER = re.compile(r"{{\s*(name|email)\s*}}")
+
+
+def split_placeholders(text):
+    """
+    Текст, разбитый на части: четные - обычный текст, нечетные - имена подстановок
+    (None, если подстановок нет)
+    """
+    parts = PLACEHOLDER.split(text)
+    return parts if len(parts) > 1 else None
+
+
+def fill_placeholders(parts, values):
+    return "".join(values[part] if index % 2 else part for index, part in enumerate(parts))
+
+
+class PreparedMIMEMessage:
+    """
+    MIME-письмо из готовых байтов: для SMTP-, console- и locmem-бэкендов
+    ведет себя как результат EmailMessage.message()
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+    def as_bytes(self, linesep="\n"):
+        if linesep == "\r\n":
+            return self.data
+        return self.data.replace(b"\r\n", linesep.encode())
+
+    def as_string(self, linesep="\n"):
+        return self.as_bytes(linesep).decode()
+
+    def get_charset(self):
+        return None
+
+
+class PreparedMessage(EmailMessage):
+    """
+    Письмо одному получателю из общего для всех получателей закодированного
+    тела payload: для каждого письма добавляются только заголовки To и Message-ID
+    """
+
+    def __init__(self, payload, from_email, to):
+        super().__init__(from_email=from_email, to=[to])
+        self.payload = payload
+
+    def message(self):
+        encoding = self.encoding or settings.DEFAULT_CHARSET
+        to = forbid_multi_line_headers("To", self.to[0], encoding)[1]
+        headers = f"To: {to}\r\nMessage-ID: {make_msgid(domain=DNS_NAME)}\r\n"
+        return PreparedMIMEMessage(headers.encode() + self.payload)
+
+
+class NewsletterRenderer:
+    """
+    Письма рассылки получателям. Без подстановок MIME-письмо строится и кодируется
+    один раз за запуск; с подстановками ({{ name }}, {{ email }}) тема и текст
+    разбираются один раз, для каждого клиента только заполняются. Остальные
+    фигурные скобки в тексте отправляются как есть
+    """
+
+    def __init__(self, subject, body, from_email):
+        self.from_email = from_email
+        self.subject, self.body = subject, body
+        self.subject_parts = split_placeholders(subject)
+        self.body_parts = split_placeholders(body)
+        self.payload = None
+        if self.subject_parts is None and self.body_parts is None:
+            message = EmailMessage(subject=subject, body=body, from_email=from_email).message()
+            del message["Message-ID"]
+            self.payload = message.as_bytes(linesep="\r\n")
+
+    def build(self, email, name=""):
+        """
+        Письмо клиенту
+        """
+        if self.payload is not None:
+            return PreparedMessage(self.payload, self.from_email, email)
+        values = {"name": name or "", "email": email}
+        subject = self.subject
+        if self.subject_parts is not None:
+            # тема письма - одна строка
+            subject = " ".join(fill_placeholders(self.subject_parts, values).split())
+        body = self.body
+        if self.body_parts is not None:
+            body = fill_placeholders(self.body_parts, values)
+        return EmailMessage(subject=subject, body=body, from_email=self.from_email, to=[email])
@@ -0,0 +1,99 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Min
+from django.utils import timezone
+
+from email_newsletter.cron import create_executor, run_scheduled_job
+from email_newsletter.delivery import get_connection_pool
+from email_newsletter.models import Newsletter, DeliveryRetry, OutgoingEmail
+from email_newsletter.outbox import drain_outbox
+
+logger = logging.getLogger(__name__)
+
+# минимальная пауза между проходами, сек (защита от холостого цикла)
+MIN_SLEEP = 1.0
+
+
+class Scheduler:
+    """
+    Постоянно работающий планировщик рассылок: спит до ближайшей отправки
+    (но не дольше max_sleep, чтобы увидеть новые рассылки), держит открытыми
+    соединения с БД и пул SMTP-соединений, останавливается по stop()
+    после завершения текущего прохода
+    """
+
+    def __init__(self, max_sleep=None, with_outbox=True):
+        self.max_sleep = max_sleep or settings.SCHEDULER_MAX_SLEEP
+        self.with_outbox = with_outbox  # отправлять и очередь исходящих писем
+        self.stopping = threading.Event()
+
+    def stop(self, *args):
+        """
+        Остановка (подходит как обработчик сигнала)
+        """
+        self.stopping.set()
+
+    def next_wakeup(self, current_datetime):
+        """
+        Время ближайшей отправки рассылки, повтора или письма из очереди
+        (рассылки, захваченные другими обработчиками, - по окончании аренды)
+        """
+        scheduled = Newsletter.objects.scheduled(current_datetime)
+        times = [
+            scheduled.not_locked(current_datetime).aggregate(at=Min("next_run_at"))["at"],
+            scheduled.filter(locked_until__gt=current_datetime).aggregate(
+                at=Min("locked_until")
+            )["at"],
+            DeliveryRetry.objects.filter(newsletter__is_active=True).aggregate(
+                at=Min("next_try_at")
+            )["at"],
+        ]
+        if self.with_outbox:
+            times.append(
+                OutgoingEmail.objects.filter(status=OutgoingEmail.PENDING).aggregate(
+                    at=Min("next_try_at")
+                )["at"]
+            )
+        times = [value for value in times if value is not None]
+        return min(times) if times else None
+
+    def get_sleep_time(self):
+        current_datetime = timezone.now()
+        wakeup = self.next_wakeup(current_datetime)
+        if wakeup is None:
+            return self.max_sleep
+        delay = (wakeup - current_datetime).total_seconds()
+        return min(max(delay, MIN_SLEEP), self.max_sleep)
+
+    def run_once(self):
+        """
+        Один проход: рассылки и повторы, затем очередь исходящих писем
+        """
+        run_scheduled_job(self.executor)
+        if self.with_outbox:
+            while drain_outbox() and not self.stopping.is_set():
+                pass
+
+    def run(self, lock=None):
+        """
+        Работа до вызова stop() (или потери блокировки lock)
+        """
+        with create_executor() as self.executor:
+            while not self.stopping.is_set():
+                if lock is not None and not lock.is_held():
+                    logger.error("Блокировка планировщика потеряна, остановка")
+                    break
+                try:
+                    self.run_once()
+                    delay = self.get_sleep_time()
+                except Exception:
+                    logger.exception("Ошибка прохода планировщика рассылок")
+                    # при обрыве соединения с БД следующий проход откроет новое
+                    connections.close_all()
+                    delay = self.max_sleep
+                self.stopping.wait(delay)
+        get_connection_pool().close()
+        connections.close_all()
@@ -1,20 +1,186 @@
+import random
+from datetime import datetime, time, timedelta
+
 from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
 
 from blog.models import Blog
-from config.settings import CACHE_ENABLED
+from config.settings import CACHE_ENABLED, BLOG_CACHE_TIMEOUT, HOMEPAGE_STATS_TIMEOUT
+from email_newsletter.models import Attempt, Client, Delivery, Newsletter
+from email_newsletter.stats import get_total_summary
+
+
+BLOG_PKS_KEY = "blog_pks"
+# ключ кеша значений полей одной статьи
+BLOG_ROW_KEY = "blog_row:{}"
+HOMEPAGE_STATS_KEY = "homepage_stats"
+# поля статьи, которые хранятся в кеше (без содержимого)
+BLOG_LIST_FIELDS = ("id", "title", "preview", "created_at")
+# количество попыток без отправок клиентам (старая история) в отчете
+REPORT_ATTEMPTS_LIMIT = 50
+
+
+def get_blog_pks():
+    """
+    Первичные ключи статей: из кеша, если нет в кеше - из БД (только индекс pk)
+    с сохранением в кеш
+    """
+    pks = cache.get(BLOG_PKS_KEY) if CACHE_ENABLED else None
+    if pks is None:
+        pks = list(Blog.objects.values_list("pk", flat=True))
+        if CACHE_ENABLED:
+            cache.set(BLOG_PKS_KEY, pks, BLOG_CACHE_TIMEOUT)
+    return pks
+
+
+def get_blogs_from_cache(pks):
+    """
+    Статьи с ключами pks: значения полей берутся из кеша (по ключу на статью),
+    из БД читаются только отсутствующие в кеше - с сохранением в кеш
+    """
+    rows = {}
+    if CACHE_ENABLED:
+        cached = cache.get_many([BLOG_ROW_KEY.format(pk) for pk in pks])
+        rows = {row[0]: row for row in cached.values()}
+    missing = [pk for pk in pks if pk not in rows]
+    if missing:
+        fetched = {
+            row[0]: row
+            for row in Blog.objects.filter(pk__in=missing).values_list(*BLOG_LIST_FIELDS)
+        }
+        if CACHE_ENABLED and fetched:
+            cache.set_many(
+                {BLOG_ROW_KEY.format(pk): row for pk, row in fetched.items()}, BLOG_CACHE_TIMEOUT
+            )
+        rows.update(fetched)
+    return [Blog(**dict(zip(BLOG_LIST_FIELDS, rows[pk]))) for pk in pks if pk in rows]
+
+
+def get_random_blogs(count):
+    """
+    Случайные статьи: выбираются случайные ключи из кешированного списка,
+    статьи берутся из кеша (при прогретом кеше - без запросов к БД)
+    """
+    pks = get_blog_pks()
+    return get_blogs_from_cache(random.sample(pks, min(count, len(pks))))
+
+
+def clear_blog_cache(pk=None):
+    """
+    Удаление из кеша списка ключей статей и статьи pk (при изменении статьи);
+    без pk - и всех статей из списка
+    """
+    if pk is None:
+        pks = cache.get(BLOG_PKS_KEY) or []
+        cache.delete_many([BLOG_ROW_KEY.format(blog_pk) for blog_pk in pks])
+    else:
+        cache.delete(BLOG_ROW_KEY.format(pk))
+    cache.delete(BLOG_PKS_KEY)
+
+
+def get_homepage_stats():
+    """
+    Счетчики главной страницы: из кеша (HOMEPAGE_STATS_TIMEOUT),
+    если нет в кеш - то из БД с сохранением в кеш
+    """
+    stats = cache.get(HOMEPAGE_STATS_KEY) if CACHE_ENABLED else None
+    if stats is None:
+        stats = {
+            # количество рассылок
+            "count_mailings": Newsletter.objects.count(),
+            # количество активных рассылок
+            "count_mailings_is_active": Newsletter.objects.filter(is_active=True).count(),
+            # количество уникальных клиентов
+            "unique_clients": Client.objects.values("email").distinct().count(),
+            # итоги отправки сообщений клиентам
+            "delivery_totals": get_total_summary(),
+        }
+        if CACHE_ENABLED:
+            cache.set(HOMEPAGE_STATS_KEY, stats, HOMEPAGE_STATS_TIMEOUT)
+    return stats
+
+
+def clear_homepage_stats():
+    """
+    Удаление счетчиков главной страницы из кеша (при изменении рассылок и клиентов)
+    """
+    cache.delete(HOMEPAGE_STATS_KEY)
+
+
+def filter_by_period(queryset, field, date_from=None, date_to=None):
+    """
+    Записи, у которых время field попадает в период с date_from по date_to включительно
+    """
+    if date_from:
+        queryset = queryset.filter(
+            **{f"{field}__gte": timezone.make_aware(datetime.combine(date_from, time.min))}
+        )
+    if date_to:
+        queryset = queryset.filter(
+            **{f"{field}__lt": timezone.make_aware(
+                datetime.combine(date_to + timedelta(days=1), time.min)
+            )}
+        )
+    return queryset
+
+
+def get_report_deliveries(user, date_from=None, date_to=None):
+    """
+    Отправки клиентам по рассылкам пользователя (новые сверху)
+    за период с date_from по date_to включительно (по индексу владелец + время)
+    """
+    deliveries = (
+        Delivery.objects.filter(owner=user)
+        .select_related("attempt", "newsletter__message")
+        .order_by("-created_at", "-pk")
+    )
+    return filter_by_period(deliveries, "created_at", date_from, date_to)
+
+
+def get_report_attempts(user, date_from=None, date_to=None, limit=REPORT_ATTEMPTS_LIMIT):
+    """
+    Последние попытки рассылок пользователя за период, по которым нет отправок
+    клиентам (записаны до появления журнала отправок): их итог есть только в попытке
+    """
+    attempts = (
+        Attempt.objects.filter(newsletter__owner=user)
+        .filter(~Exists(Delivery.objects.filter(attempt=OuterRef("pk"))))
+        .select_related("newsletter__message")
+        .order_by("-last_data", "-pk")
+    )
+    return list(filter_by_period(attempts, "last_data", date_from, date_to)[:limit])
 
 
-def get_blog_from_cache():
+def get_report_page(deliveries, after=None, before=None, page_size=50):
     """
-    Если статьи есть, то берем из в кеш,
-    если нет в кеш - то из БД
+    Страница отчета по ключу (keyset): отправки после (before - перед) отправки с pk
+    after/before в порядке отчета. Без OFFSET и подсчета всех строк, поэтому любая
+    страница читается по индексу одинаково быстро.
+    Возвращает (отправки, pk для ссылки назад, pk для ссылки вперед) - None, если ссылки нет
     """
-    if not CACHE_ENABLED:
-        return Blog.objects.all()
-    key = "blogs_list"
-    blogs = cache.get(key)
-    if blogs is not None:
-        return blogs
-    blogs = Blog.objects.all()
-    cache.get(key)
-    return blogs
+    cursor = before or after
+    created_at = None
+    if cursor:
+        created_at = deliveries.filter(pk=cursor).values_list("created_at", flat=True).first()
+    if created_at is None:
+        # ключ не найден (удален, другой пользователь или период) - первая страница
+        rows = list(deliveries[:page_size + 1])
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        has_previous = False
+    elif before:
+        newer = Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=before)
+        rows = list(deliveries.filter(newer).reverse()[:page_size + 1])
+        has_previous = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        has_next = True
+    else:
+        older = Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=after)
+        rows = list(deliveries.filter(older)[:page_size + 1])
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        has_previous = True
+    previous_pk = rows[0].pk if has_previous and rows else None
+    next_pk = rows[-1].pk if has_next and rows else None
+    return rows, previous_pk, next_pk
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from blog.models import Blog
+from email_newsletter.models import Client, Newsletter
+from email_newsletter.services import clear_blog_cache, clear_homepage_stats
+
+
+@receiver([post_save, post_delete], sender=Blog)
+def blog_changed(sender, instance, **kwargs):
+    """
+    Сброс кеша статьи и списка статей при изменении или удалении статьи
+    """
+    clear_blog_cache(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Newsletter)
+@receiver([post_save, post_delete], sender=Client)
+def homepage_stats_changed(sender, **kwargs):
+    """
+    Сброс счетчиков главной страницы при изменении рассылок и клиентов
+    """
+    clear_homepage_stats()
@@ -0,0 +1,106 @@
+import socketserver
+import threading
+import time
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """
+    Обработчик одной SMTP-сессии локального сервера-заглушки.
+    Письма не доставляются, а только подсчитываются.
+    Адреса вида reject...@ отклоняются с кодом 550 (постоянная ошибка),
+    адреса вида defer...@ - с кодом 451 (временная ошибка),
+    отправитель вида reject...@ - с кодом 553 (отказ по адресу отправителя).
+    После max_messages писем сервер закрывает соединение без ответа.
+    """
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.sessions += 1
+        self.reply("220 smtp-sink ready")
+        recipients = []
+        session_messages = 0
+        for raw_line in self.rfile:
+            command = raw_line.decode(errors="replace").strip()
+            verb = command[:4].upper()
+            if verb in ("EHLO", "HELO"):
+                self.wfile.write(b"250-smtp-sink\r\n250-AUTH PLAIN\r\n250 8BITMIME\r\n")
+            elif verb == "AUTH":
+                self.reply("235 2.7.0 Authentication successful")
+            elif verb == "MAIL":
+                recipients = []
+                address = command.partition(":")[2].strip().strip("<>")
+                if address.startswith("reject"):
+                    self.reply("553 5.1.8 Sender address rejected")
+                else:
+                    self.reply("250 OK")
+            elif verb == "RCPT":
+                address = command.partition(":")[2].strip().strip("<>")
+                if address.startswith("reject"):
+                    self.reply("550 5.1.1 Mailbox unavailable")
+                elif address.startswith("defer"):
+                    self.reply("451 4.3.0 Try again later")
+                else:
+                    recipients.append(address)
+                    self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                for data_line in self.rfile:
+                    if data_line in (b".\r\n", b".\n"):
+                        break
+                if server.delay:
+                    time.sleep(server.delay)
+                with server.lock:
+                    server.messages += 1
+                self.reply("250 OK queued")
+                session_messages += 1
+                if server.max_messages and session_messages >= server.max_messages:
+                    # лимит писем на сессию: сервер разрывает соединение
+                    return
+            elif verb == "RSET":
+                recipients = []
+                self.reply("250 OK")
+            elif verb == "NOOP":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """
+    Локальный SMTP-сервер для проверки и замеров отправки рассылок
+    (delay - искусственная задержка ответа на каждое письмо, сек,
+    max_messages - писем за одну сессию, 0 - без ограничения)
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0, delay=0.0, max_messages=0):
+        super().__init__((host, port), SMTPSinkHandler)
+        self.delay = delay
+        self.max_messages = max_messages
+        self.lock = threading.Lock()
+        self.sessions = 0  # количество SMTP-сессий (подключений)
+        self.messages = 0  # количество принятых писем
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        """
+        Запуск сервера в фоновом потоке
+        """
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,88 @@
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from email_newsletter.func import success_rate
+from email_newsletter.models import Attempt, Delivery, DeliveryStat
+
+
+def record_delivery_stat(newsletter, sent_at, sent, failed):
+    """
+    Прибавить результаты попытки к счетчикам рассылки за день начала попытки sent_at
+    (так же день считается и при пересчете rebuild_delivery_stats)
+    """
+    if not (sent or failed):
+        return
+    day = timezone.localdate(sent_at)
+    stat, created = DeliveryStat.objects.get_or_create(
+        newsletter=newsletter,
+        day=day,
+        defaults={"owner_id": newsletter.owner_id, "sent": sent, "failed": failed},
+    )
+    if not created:
+        DeliveryStat.objects.filter(pk=stat.pk).update(
+            sent=F("sent") + sent, failed=F("failed") + failed
+        )
+
+
+def rebuild_delivery_stats():
+    """
+    Пересчет статистики по журналу отправок клиентам. День - по началу попытки,
+    как при записи после рассылки: попытка через полночь не делится на два дня
+    """
+    rows = (
+        Delivery.objects.annotate(day=TruncDate("attempt__last_data"))
+        .values("newsletter", "newsletter__owner", "day")
+        .annotate(
+            sent=Count("pk", filter=Q(status=Attempt.SENT)),
+            failed=Count("pk", filter=~Q(status=Attempt.SENT)),
+        )
+        .order_by()
+    )
+    with transaction.atomic():
+        DeliveryStat.objects.all().delete()
+        stats = DeliveryStat.objects.bulk_create(
+            (
+                DeliveryStat(
+                    newsletter_id=row["newsletter"],
+                    owner_id=row["newsletter__owner"],
+                    day=row["day"],
+                    sent=row["sent"],
+                    failed=row["failed"],
+                )
+                for row in rows.iterator()
+            ),
+            batch_size=1000,
+        )
+    return len(stats)
+
+
+def get_newsletter_summary(user, date_from=None, date_to=None):
+    """
+    Итоги отправки по рассылкам пользователя за период
+    """
+    stats = DeliveryStat.objects.filter(owner=user)
+    if date_from:
+        stats = stats.filter(day__gte=date_from)
+    if date_to:
+        stats = stats.filter(day__lte=date_to)
+    rows = list(
+        stats.values("newsletter", "newsletter__message__subject")
+        .annotate(sent=Sum("sent"), failed=Sum("failed"))
+        .order_by("newsletter")
+    )
+    for row in rows:
+        row["success_rate"] = success_rate(row["sent"], row["failed"])
+    return rows
+
+
+def get_total_summary():
+    """
+    Итоги отправки по всему сервису
+    """
+    totals = DeliveryStat.objects.aggregate(sent=Sum("sent"), failed=Sum("failed"))
+    totals["sent"] = totals["sent"] or 0
+    totals["failed"] = totals["failed"] or 0
+    totals["success_rate"] = success_rate(totals["sent"], totals["failed"])
+    return totals
@@ -0,0 +1,42 @@
+from email_newsletter.delivery import RECIPIENT_ERROR
+from email_newsletter.models import Suppression
+
+# коды ответа почтового сервера, означающие несуществующий ящик
+HARD_BOUNCE_CODES = (550, 551, 553)
+
+
+def is_hard_bounce(result):
+    """
+    Постоянная ошибка адреса получателя: сервер отклонил именно получателя (RCPT TO)
+    с расширенным кодом статуса адреса 5.1.x. Отказы по отправителю, квоте
+    и содержимому письма касаются всех получателей и адрес не исключают
+    """
+    return (
+        result.error_type == RECIPIENT_ERROR
+        and result.code in HARD_BOUNCE_CODES
+        and result.answer.startswith("5.1.")
+    )
+
+
+def get_suppressed(emails):
+    """
+    Адреса (в нижнем регистре) из emails, на которые рассылки не отправляются -
+    одним запросом по индексу
+    """
+    return set(
+        Suppression.objects.filter(email__in={email.lower() for email in emails})
+        .values_list("email", flat=True)
+    )
+
+
+def suppress(results):
+    """
+    Исключение адресов, получивших жесткий отказ
+    """
+    Suppression.objects.bulk_create(
+        (
+            Suppression(email=result.email.lower(), reason=Suppression.BOUNCE, answer=result.answer)
+            for result in results
+        ),
+        ignore_conflicts=True,
+    )
@@ -1,3 +1,796 @@
-from django.test import TestCase
+import io
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from blog.models import Blog
+from email_newsletter.async_delivery import AsyncMailDelivery
+from email_newsletter.cron import (
+    get_mail_delivery,
+    get_retry_time,
+    process_newsletter,
+    process_retries,
+    send_newsletter,
+)
+from email_newsletter.delivery import (
+    DATA_ERROR,
+    RECIPIENT_ERROR,
+    SENDER_ERROR,
+    ConnectionPool,
+    DeliveryResult,
+    MailDelivery,
+    get_connection_pool,
+    reset_connection_pool,
+)
+from email_newsletter.imports import ImportResult, import_clients, iter_json_rows, iter_rows
+from email_newsletter.models import (
+    Attempt,
+    Client,
+    Delivery,
+    DeliveryRetry,
+    DeliveryStat,
+    Message,
+    Newsletter,
+    OutgoingEmail,
+    Suppression,
+)
+from email_newsletter.outbox import drain_outbox, enqueue_mail
+from email_newsletter.ratelimit import RateLimiter, TokenBucket, reset_rate_limiter
+from email_newsletter.rendering import NewsletterRenderer, PreparedMessage
+from email_newsletter.services import (
+    get_random_blogs,
+    get_report_attempts,
+    get_report_deliveries,
+    get_report_page,
+)
+from email_newsletter.smtp_sink import SMTPSink
+from email_newsletter.stats import rebuild_delivery_stats, record_delivery_stat
+from email_newsletter.suppression import is_hard_bounce
+from users.models import User
+
+MOSCOW = ZoneInfo("Europe/Moscow")
+
+
+class SMTPSinkMixin:
+    """
+    Локальная SMTP-заглушка вместо почтового сервера на время тестов класса
+    """
+    sink_max_messages = 0  # писем за сессию, после чего заглушка рвет соединение
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.sink = SMTPSink(max_messages=cls.sink_max_messages).start()
+        cls.addClassCleanup(cls.sink.stop)
+        cls.enterClassContext(
+            override_settings(
+                EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+                EMAIL_HOST="127.0.0.1",
+                EMAIL_PORT=cls.sink.port,
+                EMAIL_HOST_USER="sender@example.com",
+                EMAIL_HOST_PASSWORD="password",
+                EMAIL_USE_TLS=False,
+                EMAIL_USE_SSL=False,
+                EMAIL_DELIVERY_MODE="sync",
+                EMAIL_RATE_LIMIT=0,
+                EMAIL_SENDER_RATE_LIMIT=0,
+                EMAIL_DOMAIN_RATE_LIMIT=0,
+                EMAIL_DOMAIN_RATE_LIMITS={},
+            )
+        )
+
+    def setUp(self):
+        super().setUp()
+        # общие пул соединений и ограничитель скорости создаются с настройками заглушки
+        reset_connection_pool()
+        reset_rate_limiter()
+        self.addCleanup(self.close_pool)
+
+    @staticmethod
+    def close_pool():
+        get_connection_pool().close()
+        reset_connection_pool()
+        reset_rate_limiter()
+
+    def make_delivery(self, from_email=None):
+        pool = ConnectionPool()
+        self.addCleanup(pool.close)
+        return MailDelivery(from_email=from_email, pool=pool, rate_limiter=RateLimiter())
+
+
+class MailDeliveryTest(SMTPSinkMixin, SimpleTestCase):
+    """
+    Отправка писем через SMTP-заглушку
+    """
+
+    def test_result_per_recipient(self):
+        results = list(
+            self.make_delivery().send(
+                "Тема", "Текст", ["ok@example.com", "defer@example.com", "reject@example.com"]
+            )
+        )
+        self.assertEqual([result.email for result in results],
+                         ["ok@example.com", "defer@example.com", "reject@example.com"])
+        self.assertEqual([result.code for result in results], [250, 451, 550])
+        self.assertEqual([result.is_sent for result in results], [True, False, False])
+        self.assertEqual([result.is_temporary_failure for result in results], [False, True, False])
+        self.assertEqual([is_hard_bounce(result) for result in results], [False, False, True])
+        self.assertEqual(results[2].error_type, RECIPIENT_ERROR)
+        self.assertTrue(results[2].answer.startswith("5.1.1"))
+
+    def test_connection_reused(self):
+        sessions = self.sink.sessions
+        results = list(self.make_delivery().send("Тема", "Текст", ["a@example.com", "b@example.com"]))
+        self.assertTrue(all(result.is_sent for result in results))
+        self.assertEqual(self.sink.sessions - sessions, 1)
+
+    def test_sender_refused(self):
+        results = list(
+            self.make_delivery("reject@example.com").send(
+                "Тема", "Текст", ["a@example.com", "b@example.com"]
+            )
+        )
+        self.assertEqual([result.code for result in results], [553, 553])
+        self.assertEqual({result.error_type for result in results}, {SENDER_ERROR})
+        self.assertFalse(any(is_hard_bounce(result) for result in results))
+
+
+class MailDeliveryReconnectTest(SMTPSinkMixin, SimpleTestCase):
+    """
+    Переподключение, когда сервер разрывает соединение после каждого письма
+    """
+    sink_max_messages = 1
+
+    def test_reconnect_after_disconnect(self):
+        sessions = self.sink.sessions
+        messages = self.sink.messages
+        emails = ["a@example.com", "b@example.com", "c@example.com"]
+        results = list(self.make_delivery().send("Тема", "Текст", emails))
+        self.assertTrue(all(result.is_sent for result in results))
+        self.assertEqual(self.sink.messages - messages, 3)
+        self.assertEqual(self.sink.sessions - sessions, 3)
+
+
+class HardBounceTest(SimpleTestCase):
+    """
+    Исключаются только адреса, отклоненные сервером как несуществующие
+    """
+
+    def make_result(self, code, answer, error_type):
+        return DeliveryResult(
+            email="client@example.com", is_sent=False, code=code, answer=answer, error_type=error_type
+        )
+
+    def test_unknown_recipient(self):
+        self.assertTrue(is_hard_bounce(self.make_result(550, "5.1.1 No such user", RECIPIENT_ERROR)))
+        self.assertTrue(is_hard_bounce(self.make_result(551, "5.1.6 User moved", RECIPIENT_ERROR)))
+
+    def test_recipient_policy_refusal(self):
+        self.assertFalse(is_hard_bounce(self.make_result(550, "5.7.1 Spam", RECIPIENT_ERROR)))
+
+    def test_temporary_recipient_error(self):
+        self.assertFalse(is_hard_bounce(self.make_result(451, "4.3.0 Try later", RECIPIENT_ERROR)))
+
+    def test_sender_refused(self):
+        self.assertFalse(is_hard_bounce(self.make_result(553, "5.1.8 Bad sender", SENDER_ERROR)))
+
+    def test_quota_exceeded(self):
+        result = self.make_result(550, "5.4.5 Daily user sending quota exceeded", DATA_ERROR)
+        self.assertFalse(is_hard_bounce(result))
+
+
+@override_settings(TIME_ZONE="Europe/Moscow")
+class NextRunAtTest(SimpleTestCase):
+    """
+    Время следующей отправки по периодичности
+    """
+
+    @staticmethod
+    def make_newsletter(periodicity, start):
+        # из БД время начала приходит в UTC
+        return Newsletter(periodicity=periodicity, start_data=start.astimezone(dt_timezone.utc))
+
+    def test_monthly_in_local_time(self):
+        newsletter = self.make_newsletter(
+            Newsletter.ONCE_A_MONTH, datetime(2025, 1, 30, 1, 0, tzinfo=MOSCOW)
+        )
+        self.assertEqual(
+            newsletter.get_next_run_at(datetime(2025, 2, 1, tzinfo=MOSCOW)),
+            datetime(2025, 2, 28, 1, 0, tzinfo=MOSCOW),
+        )
+
+    def test_monthly_after_run(self):
+        newsletter = self.make_newsletter(
+            Newsletter.ONCE_A_MONTH, datetime(2025, 1, 30, 1, 0, tzinfo=MOSCOW)
+        )
+        self.assertEqual(
+            newsletter.get_next_run_at(datetime(2025, 2, 28, 1, 0, tzinfo=MOSCOW)),
+            datetime(2025, 3, 30, 1, 0, tzinfo=MOSCOW),
+        )
+
+    def test_monthly_month_end(self):
+        newsletter = self.make_newsletter(
+            Newsletter.ONCE_A_MONTH, datetime(2024, 1, 31, 10, 0, tzinfo=MOSCOW)
+        )
+        self.assertEqual(
+            newsletter.get_next_run_at(datetime(2024, 2, 1, tzinfo=MOSCOW)),
+            datetime(2024, 2, 29, 10, 0, tzinfo=MOSCOW),
+        )
+        self.assertEqual(
+            newsletter.get_next_run_at(datetime(2024, 3, 1, tzinfo=MOSCOW)),
+            datetime(2024, 3, 31, 10, 0, tzinfo=MOSCOW),
+        )
+
+    def test_daily(self):
+        newsletter = self.make_newsletter(
+            Newsletter.ONCE_A_DAY, datetime(2025, 1, 1, 9, 0, tzinfo=MOSCOW)
+        )
+        self.assertEqual(
+            newsletter.get_next_run_at(datetime(2025, 1, 5, 12, 0, tzinfo=MOSCOW)),
+            datetime(2025, 1, 6, 9, 0, tzinfo=MOSCOW),
+        )
+
+    def test_start_in_future(self):
+        start = datetime(2025, 6, 1, 9, 0, tzinfo=MOSCOW)
+        newsletter = self.make_newsletter(Newsletter.ONCE_A_WEEK, start)
+        self.assertEqual(newsletter.get_next_run_at(datetime(2025, 5, 1, tzinfo=MOSCOW)), start)
+
+    def test_one_time(self):
+        newsletter = self.make_newsletter(
+            Newsletter.ONE_TIME, datetime(2025, 1, 1, 9, 0, tzinfo=MOSCOW)
+        )
+        self.assertIsNone(newsletter.get_next_run_at(datetime(2025, 1, 5, tzinfo=MOSCOW)))
+
+
+class NewsletterTestMixin:
+    """
+    Пользователь и его ежедневная рассылка, время отправки которой наступило
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email="owner@example.com")
+        cls.newsletter = Newsletter.objects.create(
+            start_data=timezone.now() - timedelta(hours=1),
+            periodicity=Newsletter.ONCE_A_DAY,
+            message=Message.objects.create(subject="Тема", body="Текст", owner=cls.user),
+            owner=cls.user,
+        )
+
+
+class ClaimDueTest(NewsletterTestMixin, TestCase):
+    """
+    Захват рассылок планировщиками
+    """
+
+    def test_claimed_once(self):
+        now = timezone.now()
+        self.assertEqual(Newsletter.objects.claim_due(now, "w1", 60), [self.newsletter.pk])
+        self.assertEqual(Newsletter.objects.claim_due(now, "w2", 60), [])
+        self.newsletter.refresh_from_db()
+        self.assertEqual(self.newsletter.locked_by, "w1")
+        self.assertEqual(self.newsletter.locked_until, now + timedelta(seconds=60))
+
+    def test_expired_lease_claimed_again(self):
+        now = timezone.now()
+        Newsletter.objects.claim_due(now, "w1", 60)
+        later = now + timedelta(seconds=61)
+        self.assertEqual(Newsletter.objects.claim_due(later, "w2", 60), [self.newsletter.pk])
+        self.newsletter.refresh_from_db()
+        self.assertEqual(self.newsletter.locked_by, "w2")
+
+    def test_extend_lease_by_owner_only(self):
+        now = timezone.now()
+        Newsletter.objects.claim_due(now, "w1", 60)
+        newsletters = Newsletter.objects.filter(pk=self.newsletter.pk)
+        self.assertEqual(newsletters.extend_lease(now, "w2", 600), 0)
+        self.assertEqual(newsletters.extend_lease(now, "w1", 600), 1)
+        self.newsletter.refresh_from_db()
+        self.assertEqual(self.newsletter.locked_until, now + timedelta(seconds=600))
+
+    def test_newsletter_of_other_worker_skipped(self):
+        now = timezone.now()
+        Newsletter.objects.claim_due(now, "w1", 60)
+        process_newsletter(self.newsletter.pk, now, "w2")
+        self.assertFalse(Attempt.objects.filter(newsletter=self.newsletter).exists())
+        self.newsletter.refresh_from_db()
+        self.assertEqual(self.newsletter.locked_by, "w1")
+
+
+@override_settings(
+    NEWSLETTER_RETRY_DELAY=60, NEWSLETTER_RETRY_MAX_DELAY=3600, NEWSLETTER_RETRY_MAX_ATTEMPTS=3
+)
+class SendNewsletterTest(SMTPSinkMixin, NewsletterTestMixin, TestCase):
+    """
+    Отправка рассылки через SMTP-заглушку: журнал, исключения, повторы
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.newsletter.client.add(
+            *(
+                Client.objects.create(name=name, email=f"{name}@example.com", owner=cls.user)
+                for name in ("ok", "defer", "reject")
+            )
+        )
+
+    def send(self, current_datetime):
+        Newsletter.objects.claim_due(current_datetime, "w1", 60)
+        newsletter = Newsletter.objects.select_related("message").get(pk=self.newsletter.pk)
+        send_newsletter(newsletter, current_datetime, "w1")
+
+    def test_send_newsletter(self):
+        now = timezone.now()
+        self.send(now)
+        self.assertEqual(
+            dict(Delivery.objects.values_list("email", "code")),
+            {"ok@example.com": 250, "defer@example.com": 451, "reject@example.com": 550},
+        )
+        self.assertEqual(
+            set(Delivery.objects.values_list("owner", flat=True)), {self.user.pk}
+        )
+        self.newsletter.refresh_from_db()
+        self.assertEqual(self.newsletter.status, Newsletter.LAUNCHED)
+        self.assertIsNone(self.newsletter.locked_by)
+        self.assertEqual(self.newsletter.next_run_at, self.newsletter.get_next_run_at(now))
+        # жесткий отказ - в исключения, временная ошибка - в очередь повторов
+        self.assertEqual(
+            list(Suppression.objects.values_list("email", flat=True)), ["reject@example.com"]
+        )
+        retry = DeliveryRetry.objects.get()
+        self.assertEqual(retry.email, "defer@example.com")
+        self.assertEqual(retry.attempts, 1)
+        self.assertEqual(retry.next_try_at, now + timedelta(seconds=60))
+
+    def test_retry_backoff(self):
+        now = timezone.now()
+        self.send(now)
+        retry_at = now + timedelta(seconds=60)
+        process_retries(retry_at)
+        retry = DeliveryRetry.objects.get()
+        self.assertEqual(retry.attempts, 2)
+        self.assertEqual(retry.next_try_at, retry_at + timedelta(seconds=120))
+
+        retry_at = retry.next_try_at
+        process_retries(retry_at)
+        retry = DeliveryRetry.objects.get()
+        self.assertEqual(retry.attempts, 3)
+        self.assertEqual(retry.next_try_at, retry_at + timedelta(seconds=240))
+
+        # после NEWSLETTER_RETRY_MAX_ATTEMPTS попыток повтор снимается
+        process_retries(retry.next_try_at)
+        self.assertFalse(DeliveryRetry.objects.exists())
+
+    @override_settings(NEWSLETTER_RETRY_MAX_DELAY=100)
+    def test_retry_delay_limit(self):
+        now = timezone.now()
+        self.assertEqual(get_retry_time(now, 1), now + timedelta(seconds=60))
+        self.assertEqual(get_retry_time(now, 5), now + timedelta(seconds=100))
+
+    @override_settings(EMAIL_HOST_USER="reject@example.com")
+    def test_sender_refused_does_not_suppress(self):
+        self.send(timezone.now())
+        self.assertEqual(set(Delivery.objects.values_list("code", flat=True)), {553})
+        self.assertFalse(Suppression.objects.exists())
+        self.assertFalse(DeliveryRetry.objects.exists())
+
+
+class NewsletterRendererTest(SimpleTestCase):
+    """
+    Письма рассылки: общее тело без подстановок, подстановки данных клиента
+    """
+
+    def test_without_placeholders(self):
+        renderer = NewsletterRenderer("Тема", "Текст {не шаблон}", "sender@example.com")
+        message = renderer.build("client@example.com", "Иван")
+        self.assertIsInstance(message, PreparedMessage)
+        data = message.message().as_bytes()
+        self.assertIn(b"To: client@example.com", data)
+        self.assertIn(b"Message-ID:", data)
+        # тело кодируется один раз и общее для всех получателей
+        self.assertIs(renderer.build("other@example.com").payload, message.payload)
+
+    def test_placeholders(self):
+        renderer = NewsletterRenderer(
+            "Для {{ name }}", "Привет, {{name}}! Адрес: {{ email }}", "sender@example.com"
+        )
+        message = renderer.build("client@example.com", "Иван")
+        self.assertEqual(message.subject, "Для Иван")
+        self.assertEqual(message.body, "Привет, Иван! Адрес: client@example.com")
+        self.assertEqual(message.to, ["client@example.com"])
+
+    def test_template_tags_sent_as_text(self):
+        body = "{% url 'nowhere' %} {% include 'x.html' %} {{ name }} {{ unknown }}"
+        message = NewsletterRenderer("Тема", body, "sender@example.com").build(
+            "client@example.com", "Иван"
+        )
+        self.assertEqual(message.body, "{% url 'nowhere' %} {% include 'x.html' %} Иван {{ unknown }}")
+
+
+class SendNewsletterErrorTest(NewsletterTestMixin, TestCase):
+    """
+    Ошибка во время отправки не оставляет рассылку захваченной
+    """
+
+    def test_error_finishes_attempt_and_releases_lease(self):
+        now = timezone.now()
+        Newsletter.objects.claim_due(now, "w1", 60)
+        newsletter = Newsletter.objects.select_related("message").get(pk=self.newsletter.pk)
+        with mock.patch("email_newsletter.cron.send_message", side_effect=RuntimeError("сбой")):
+            with self.assertRaises(RuntimeError):
+                send_newsletter(newsletter, now, "w1")
+        attempt = Attempt.objects.get(newsletter=self.newsletter)
+        self.assertEqual(attempt.status, Attempt.NOT_SENT)
+        self.assertIn("сбой", attempt.answer)
+        self.newsletter.refresh_from_db()
+        self.assertIsNone(self.newsletter.locked_by)
+        self.assertEqual(self.newsletter.status, Newsletter.LAUNCHED)
+        self.assertEqual(self.newsletter.next_run_at, self.newsletter.get_next_run_at(now))
+
+
+@mock.patch("email_newsletter.services.CACHE_ENABLED", True)
+class RandomBlogsTest(TestCase):
+    """
+    Случайные статьи главной страницы из кеша
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.blogs = [Blog.objects.create(title=f"Статья {number}") for number in range(3)]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_warm_cache_without_queries(self):
+        self.assertEqual(
+            {blog.pk for blog in get_random_blogs(3)}, {blog.pk for blog in self.blogs}
+        )
+        with self.assertNumQueries(0):
+            blogs = get_random_blogs(3)
+        self.assertEqual(
+            {blog.title for blog in blogs}, {"Статья 0", "Статья 1", "Статья 2"}
+        )
+
+    def test_changed_blog_reloaded(self):
+        get_random_blogs(3)
+        blog = self.blogs[0]
+        blog.title = "Новый заголовок"
+        blog.save()
+        with self.assertNumQueries(2):
+            # список ключей и измененная статья
+            titles = {blog.title for blog in get_random_blogs(3)}
+        self.assertIn("Новый заголовок", titles)
+
+    def test_deleted_blog_not_shown(self):
+        get_random_blogs(3)
+        deleted_pk = self.blogs[0].pk
+        self.blogs[0].delete()
+        self.assertNotIn(deleted_pk, {blog.pk for blog in get_random_blogs(3)})
+
+
+class IterJsonRowsTest(SimpleTestCase):
+    """
+    Чтение JSON-массива порциями: значения на границе порции не разрываются
+    """
+
+    @mock.patch("email_newsletter.imports.JSON_READ_SIZE", 4)
+    def test_number_on_read_boundary(self):
+        rows = list(iter_json_rows(io.StringIO('[12345, 67, {"email": "a@example.com"}]')))
+        self.assertEqual(rows, [12345, 67, {"email": "a@example.com"}])
+
+    @mock.patch("email_newsletter.imports.JSON_READ_SIZE", 5)
+    def test_object_longer_than_buffer(self):
+        rows = list(iter_json_rows(io.StringIO('[{"email": "a@example.com", "name": "Анна"}]')))
+        self.assertEqual(rows, [{"email": "a@example.com", "name": "Анна"}])
+
+    def test_not_array(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_rows(io.StringIO('{"email": "a@example.com"}')))
+
+
+class ImportClientsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email="owner@example.com")
+        Client.objects.create(email="Known@example.com", name="Известный", owner=cls.user)
+
+    def test_import(self):
+        rows = iter_rows(io.BytesIO(
+            "email,name\n"
+            "new@example.com,Новый\n"
+            "NEW@example.com,Повтор\n"
+            "known@example.com,Уже есть\n"
+            "broken,Ошибка\n".encode()
+        ), "csv")
+        result = import_clients(self.user, rows, batch_size=2)
+        self.assertEqual(
+            result, ImportResult(created=1, duplicates=2, invalid=1, errors=["запись 4: некорректный адрес 'broken'"])
+        )
+        self.assertEqual(
+            set(Client.objects.filter(owner=self.user).values_list("email", flat=True)),
+            {"Known@example.com", "new@example.com"},
+        )
+
+    def test_partial_result_on_read_error(self):
+        rows = iter_rows(io.BytesIO(
+            b'{"email": "first@example.com"}\n{"email": "second@example.com"}\n{"email": '
+        ), "jsonl")
+        result = import_clients(self.user, rows, batch_size=1)
+        self.assertEqual(result.created, 2)
+        self.assertTrue(result.error)
+        self.assertTrue(Client.objects.filter(email="second@example.com").exists())
+
+
+class ReportPageTest(NewsletterTestMixin, TestCase):
+    """
+    Отчет по рассылкам: страницы по ключу и попытки без отправок клиентам
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        now = timezone.now()
+        cls.attempt = Attempt.objects.create(
+            newsletter=cls.newsletter, last_data=now, status=Attempt.SENT
+        )
+        Delivery.objects.bulk_create(
+            Delivery(
+                attempt=cls.attempt,
+                newsletter=cls.newsletter,
+                owner=cls.user,
+                email=f"client{number}@example.com",
+                status=Attempt.SENT,
+            )
+            for number in range(5)
+        )
+        # одинаковое время: порядок внутри секунды задает pk
+        Delivery.objects.update(created_at=now)
+        cls.old_attempt = Attempt.objects.create(
+            newsletter=cls.newsletter, last_data=now - timedelta(days=30), status=Attempt.SENT
+        )
+        cls.other_user = User.objects.create(email="other@example.com")
+
+    def get_page(self, after=None, before=None):
+        rows, previous_pk, next_pk = get_report_page(
+            get_report_deliveries(self.user), after, before, page_size=2
+        )
+        return [row.pk for row in rows], previous_pk, next_pk
+
+    def test_pages(self):
+        pks = list(Delivery.objects.order_by("-pk").values_list("pk", flat=True))
+        self.assertEqual(self.get_page(), (pks[:2], None, pks[1]))
+        self.assertEqual(self.get_page(after=pks[1]), (pks[2:4], pks[2], pks[3]))
+        self.assertEqual(self.get_page(after=pks[3]), (pks[4:], pks[4], None))
+        self.assertEqual(self.get_page(before=pks[2]), (pks[:2], None, pks[1]))
+        self.assertEqual(self.get_page(before=pks[4]), (pks[2:4], pks[2], pks[3]))
+
+    def test_unknown_cursor_opens_first_page(self):
+        pks = list(Delivery.objects.order_by("-pk").values_list("pk", flat=True))
+        self.assertEqual(self.get_page(after=0), (pks[:2], None, pks[1]))
+
+    def test_other_user_sees_nothing(self):
+        rows, previous_pk, next_pk = get_report_page(get_report_deliveries(self.other_user))
+        self.assertEqual((rows, previous_pk, next_pk), ([], None, None))
+
+    def test_attempts_without_deliveries(self):
+        self.assertEqual(get_report_attempts(self.user), [self.old_attempt])
+        self.assertEqual(
+            get_report_attempts(self.user, date_from=timezone.localdate() - timedelta(days=7)), []
+        )
+        self.assertEqual(get_report_attempts(self.other_user), [])
+
+
+class DeliveryStatDayTest(NewsletterTestMixin, TestCase):
+    """
+    Попытка через полночь попадает в один день и при записи, и при пересчете
+    """
+
+    def test_rebuild_matches_recorded(self):
+        started = timezone.make_aware(datetime(2024, 3, 1, 23, 59))
+        attempt = Attempt.objects.create(
+            newsletter=self.newsletter, last_data=started, status=Attempt.SENT
+        )
+        Delivery.objects.bulk_create(
+            Delivery(
+                attempt=attempt,
+                newsletter=self.newsletter,
+                owner=self.user,
+                email=email,
+                status=status,
+            )
+            for email, status in (
+                ("a@example.com", Attempt.SENT),
+                ("b@example.com", Attempt.SENT),
+                ("c@example.com", Attempt.NOT_SENT),
+            )
+        )
+        # отправки закончились уже на следующий день
+        Delivery.objects.update(created_at=started + timedelta(minutes=5))
+        record_delivery_stat(self.newsletter, attempt.last_data, 2, 1)
+        fields = ("newsletter", "day", "sent", "failed")
+        recorded = list(DeliveryStat.objects.values_list(*fields))
+        rebuild_delivery_stats()
+        self.assertEqual(list(DeliveryStat.objects.values_list(*fields)), recorded)
+        self.assertEqual(recorded, [(self.newsletter.pk, started.date(), 2, 1)])
+
+
+@override_settings(EMAIL_DELIVERY_MODE="async")
+class GetMailDeliveryTest(SimpleTestCase):
+    """
+    asyncio-режим - только вместо SMTP-backend
+    """
+
+    @override_settings(EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend")
+    def test_async_with_smtp_backend(self):
+        self.assertIsInstance(get_mail_delivery(), AsyncMailDelivery)
+
+    @override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+    def test_other_backend_sends_without_async(self):
+        with self.assertLogs("email_newsletter.cron", "WARNING"):
+            delivery = get_mail_delivery()
+        self.assertNotIsInstance(delivery, AsyncMailDelivery)
+
+
+@override_settings(OUTBOX_RETRY_DELAY=60, OUTBOX_MAX_RETRY_DELAY=3600, OUTBOX_MAX_ATTEMPTS=3)
+class DrainOutboxTest(SMTPSinkMixin, TestCase):
+    """
+    Очередь служебных писем: повторы с растущей задержкой, стирание текста писем
+    """
+
+    def drain(self, expected_delay=None):
+        # письмо, ожидающее повтора, отправляется сразу
+        OutgoingEmail.objects.filter(status=OutgoingEmail.PENDING).update(
+            next_try_at=timezone.now()
+        )
+        started = timezone.now()
+        drain_outbox()
+        finished = timezone.now()
+        email = OutgoingEmail.objects.get(recipient="defer@example.com")
+        if expected_delay is not None:
+            delay = timedelta(seconds=expected_delay)
+            self.assertTrue(started + delay <= email.next_try_at <= finished + delay)
+        return email
+
+    def test_sent_and_retried(self):
+        enqueue_mail("Подтверждение", "ссылка с токеном", "ok@example.com")
+        enqueue_mail("Подтверждение", "ссылка с токеном", "defer@example.com")
+        email = self.drain(expected_delay=60)
+        self.assertEqual((email.status, email.attempts), (OutgoingEmail.PENDING, 1))
+        self.assertEqual(email.body, "ссылка с токеном")
+        self.assertEqual(email.last_error, "4.3.0 Try again later")
+        sent = OutgoingEmail.objects.get(recipient="ok@example.com")
+        self.assertEqual(sent.status, OutgoingEmail.SENT)
+        self.assertIsNotNone(sent.sent_at)
+        self.assertEqual(sent.body, "")
+
+        email = self.drain(expected_delay=120)
+        self.assertEqual(email.attempts, 2)
+        # после OUTBOX_MAX_ATTEMPTS попыток письмо не отправлено, текст стерт
+        email = self.drain()
+        self.assertEqual((email.status, email.attempts), (OutgoingEmail.FAILED, 3))
+        self.assertEqual(email.body, "")
+        self.assertEqual(drain_outbox(), 0)
+
+    def test_claimed_emails_not_taken_again(self):
+        enqueue_mail("Подтверждение", "ссылка с токеном", "defer@example.com")
+        with mock.patch(
+            "email_newsletter.outbox.MailDelivery.send_messages", side_effect=RuntimeError
+        ):
+            # обработчик упал при отправке: письма остаются отложенными на OUTBOX_LEASE
+            with self.assertRaises(RuntimeError):
+                drain_outbox()
+        self.assertEqual(drain_outbox(), 0)
+
+
+class RateLimitTest(SimpleTestCase):
+    """
+    Ведра токенов на управляемых часах (time.monotonic)
+    """
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch("email_newsletter.ratelimit.time.monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_bucket_burst_then_rate(self):
+        bucket = TokenBucket(rate=2, capacity=3)
+        self.assertEqual([bucket.reserve() for _ in range(3)], [0.0, 0.0, 0.0])
+        # сверх capacity - в долг, по 1 / rate секунды на письмо
+        self.assertEqual([bucket.reserve() for _ in range(2)], [0.5, 1.0])
+        self.now += 1.0
+        self.assertEqual(bucket.reserve(), 0.5)
+
+    def test_bucket_refill_limited_by_capacity(self):
+        bucket = TokenBucket(rate=1, capacity=2)
+        self.now += 60
+        self.assertEqual([bucket.reserve() for _ in range(3)], [0.0, 0.0, 1.0])
+
+    def test_domain_and_sender_limits(self):
+        limiter = RateLimiter(
+            global_rate=0, sender_rate=0, domain_rate=1, domain_rates={"gmail.com": 2}
+        )
+        self.assertEqual(limiter.reserve("s@example.com", "a@mail.ru"), 0.0)
+        self.assertEqual(limiter.reserve("s@example.com", "b@MAIL.ru"), 1.0)
+        # у других доменов - свои ведра и лимиты
+        self.assertEqual(limiter.reserve("s@example.com", "a@gmail.com"), 0.0)
+        self.assertEqual(limiter.reserve("s@example.com", "b@gmail.com"), 0.0)
+        self.assertEqual(limiter.reserve("s@example.com", "c@gmail.com"), 0.5)
+
+        limiter = RateLimiter(global_rate=0, sender_rate=1, domain_rate=0, domain_rates={})
+        self.assertEqual(limiter.reserve("s@example.com", "a@mail.ru"), 0.0)
+        self.assertEqual(limiter.reserve("s@example.com", "b@gmail.com"), 1.0)
+        self.assertEqual(limiter.reserve("other@example.com", "c@gmail.com"), 0.0)
+
+    def test_strictest_limit_wins(self):
+        limiter = RateLimiter(global_rate=10, sender_rate=0, domain_rate=1, domain_rates={})
+        limiter.reserve("s@example.com", "a@mail.ru")
+        self.assertEqual(limiter.reserve("s@example.com", "b@mail.ru"), 1.0)
+
+    def test_without_limits(self):
+        limiter = RateLimiter(global_rate=0, sender_rate=0, domain_rate=0, domain_rates={})
+        with mock.patch("email_newsletter.ratelimit.time.sleep") as sleep:
+            for _ in range(100):
+                limiter.wait("s@example.com", "a@mail.ru")
+        sleep.assert_not_called()
+
+
+class OwnerListViewTest(TestCase):
+    """
+    Списки клиентов, сообщений и рассылок - только свои объекты (фильтр в запросе к БД)
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(email="owner@example.com")
+        cls.other_user = User.objects.create(email="other@example.com")
+        for user in (cls.user, cls.other_user):
+            Client.objects.create(email=f"client-{user.pk}@example.com", name="Клиент", owner=user)
+            for is_active in (True, False):
+                Newsletter.objects.create(
+                    start_data=timezone.now(),
+                    periodicity=Newsletter.ONCE_A_DAY,
+                    message=Message.objects.create(subject="Тема", body="Текст", owner=user),
+                    owner=user,
+                    is_active=is_active,
+                )
+
+    def get_objects(self, user, url_name):
+        self.client.force_login(user)
+        response = self.client.get(reverse(f"email_newsletter:{url_name}"))
+        self.assertEqual(response.status_code, 200)
+        return list(response.context["object_list"])
+
+    def test_own_objects_only(self):
+        self.assertEqual(
+            self.get_objects(self.user, "client"), list(Client.objects.filter(owner=self.user))
+        )
+        self.assertEqual(
+            self.get_objects(self.user, "message"), list(Message.objects.filter(owner=self.user))
+        )
+        # обычный пользователь видит только свои активные рассылки
+        self.assertEqual(
+            self.get_objects(self.user, "newsletter"),
+            list(Newsletter.objects.filter(owner=self.user, is_active=True)),
+        )
+
+    def test_superuser_sees_all(self):
+        admin = User.objects.create(email="admin@example.com", is_superuser=True)
+        self.assertEqual(len(self.get_objects(admin, "client")), 2)
+        self.assertEqual(len(self.get_objects(admin, "message")), 4)
+
+    def test_manager_sees_all_newsletters(self):
+        manager = User.objects.create(email="manager@example.com")
+        manager.user_permissions.add(
+            *Permission.objects.filter(codename__in=("view_newsletter", "cancel_active_status"))
+        )
+        self.assertEqual(len(self.get_objects(manager, "newsletter")), 4)
+        self.assertEqual(self.get_objects(manager, "client"), [])
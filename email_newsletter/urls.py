@@ -3,9 +3,10 @@ from django.urls import path
 from email_newsletter.apps import EmailNewsletterConfig
 from email_newsletter.views import (NewsletterListView, NewsletterCreateView, NewsletterUpdateView,
                                     NewsletterDeleteView, NewsletterDetailView, ClientListView, ClientCreateView,
-                                    ClientUpdateView, ClientDeleteView, ClientDetailView, MessageListView,
-                                    MessageCreateView, MessageUpdateView, MessageDeleteView, MessageDetailView,
-                                    homepage, get_mailing_report
+                                    ClientImportView, ClientUpdateView, ClientDeleteView, ClientDetailView,
+                                    MessageListView, MessageCreateView, MessageUpdateView, MessageDeleteView,
+                                    MessageDetailView, homepage, get_mailing_report,
+                                    export_mailing_report, request_stats
                                     )
 
 app_name = EmailNewsletterConfig.name
@@ -21,6 +22,7 @@ urlpatterns = [
 
     path('client/', ClientListView.as_view(), name='client'),
     path('client/create_client/', ClientCreateView.as_view(), name='create_client'),
+    path('client/import_clients/', ClientImportView.as_view(), name='import_clients'),
     path('client/update_client/<int:pk>', ClientUpdateView.as_view(), name='update_client'),
     path('client/delete_client/<int:pk>', ClientDeleteView.as_view(), name='delete_client'),
     path('client/view_client/<int:pk>', ClientDetailView.as_view(), name='view_client'),
@@ -32,4 +34,7 @@ urlpatterns = [
     path('message/view_message/<int:pk>', MessageDetailView.as_view(), name='view_message'),
 
     path('mailing_report/', get_mailing_report, name='mailing_report'),
+    path('mailing_report/export.<str:export_format>', export_mailing_report, name='export_mailing_report'),
+
+    path('request_stats/', request_stats, name='request_stats'),
 ]
@@ -1,8 +1,8 @@
-import random
-
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.exceptions import PermissionDenied
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.urls import reverse_lazy
 from django.views.generic import (
@@ -11,6 +11,7 @@ from django.views.generic import (
     UpdateView,
     DeleteView,
     DetailView,
+    FormView,
 )
 
 from email_newsletter.forms import (
@@ -18,13 +19,53 @@ from email_newsletter.forms import (
     NewsletterModeratorForm,
     NewsletterModeratorOwnerForm,
     ClientForm,
+    ClientImportForm,
     MessageForm,
+    MailingReportFilterForm,
+)
+from email_newsletter.exports import (
+    EXPORT_FORMATS,
+    iter_report_csv,
+    iter_report_jsonl,
+    iter_report_rows,
 )
-from email_newsletter.models import Newsletter, Client, Message, Attempt
-from email_newsletter.services import get_blog_from_cache
+from email_newsletter.instrumentation import registry
+from email_newsletter.imports import get_import_format, import_clients, iter_rows
+from email_newsletter.models import Newsletter, Client, Message
+from email_newsletter.services import (
+    REPORT_ATTEMPTS_LIMIT,
+    get_homepage_stats,
+    get_random_blogs,
+    get_report_attempts,
+    get_report_deliveries,
+    get_report_page,
+)
+from email_newsletter.stats import get_newsletter_summary
+
+
+class OwnerQuerySetMixin:
+    """
+    Список только своих объектов (фильтр по владельцу в запросе к БД)
+    с разбивкой на страницы
+    """
+    paginate_by = 12
+    ordering = ("pk",)
 
+    def can_view_all(self, user):
+        """
+        Права доступа на просмотр всех объектов.
+        """
+        return user.is_superuser
+
+    def get_queryset(self):
+        queryset = super().get_queryset().select_related("owner")
+        user = self.request.user
+        if self.can_view_all(user):
+            return queryset
+        return queryset.filter(owner_id=user.pk)
 
-class NewsletterListView(LoginRequiredMixin, ListView):
+
+class NewsletterListView(LoginRequiredMixin, OwnerQuerySetMixin, ListView):
     model = Newsletter
     extra_context = {
         "title": "Здесь находится список Ваших рассылок",
@@ -36,26 +77,19 @@ class NewsletterListView(LoginRequiredMixin, ListView):
         "create_object": "Создать новую рассылку",
     }
 
-    def get_context_data(self, **kwargs):
+    def can_view_all(self, user):
         """
         Права доступа на просмотр всех рассылок и возможность отключения рассылок.
         """
-        context_data = super().get_context_data(**kwargs)
-        user = self.request.user
-        if user.has_perm("email_newsletter.view_newsletter") and user.has_perm(
+        return user.has_perm("email_newsletter.view_newsletter") and user.has_perm(
             "email_newsletter.cancel_active_status"
-        ):
-            return context_data
-        else:
-            object_list = list(
-                filter(
-                    lambda x: (x.owner == user),
-                    Newsletter.objects.filter(is_active=True),
-                )
-            )
-            # print(object_list)
-            context_data["object_list"] = object_list
-            return context_data
+        )
+
+    def get_queryset(self):
+        queryset = super().get_queryset().select_related("message")
+        if not self.can_view_all(self.request.user):
+            queryset = queryset.filter(is_active=True)
+        return queryset
 
 
 class NewsletterCreateView(LoginRequiredMixin, CreateView):
@@ -180,7 +214,7 @@ class NewsletterDetailView(LoginRequiredMixin, DetailView):
         raise PermissionDenied
 
 
-class ClientListView(LoginRequiredMixin, ListView):
+class ClientListView(LoginRequiredMixin, OwnerQuerySetMixin, ListView):
     model = Client
     extra_context = {
         "title": "Здесь находится список Ваших клиентов",
@@ -191,21 +225,6 @@ class ClientListView(LoginRequiredMixin, ListView):
         "create_object": "Создать нового клиента",
     }
 
-    def get_context_data(self, **kwargs):
-        """
-        Права доступа на просмотр всех клиентов.
-        """
-        context_data = super().get_context_data(**kwargs)
-        user = self.request.user
-        if user.is_superuser:
-            return context_data
-        else:
-            object_list = list(
-                filter(lambda x: (x.owner == user), Client.objects.all())
-            )
-            context_data["object_list"] = object_list
-            return context_data
-
 
 class ClientCreateView(LoginRequiredMixin, CreateView):
     model = Client
@@ -232,6 +251,28 @@ class ClientCreateView(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
+class ClientImportView(LoginRequiredMixin, FormView):
+    form_class = ClientImportForm
+    template_name = "email_newsletter/client_import.html"
+    extra_context = {
+        "title": "Здесь можно загрузить базу клиентов из файла",
+        "text": "Файл CSV или JSON читается потоком и загружается пачками: "
+        "адреса с ошибками и клиенты, которые у Вас уже есть, пропускаются.",
+    }
+
+    def form_valid(self, form):
+        """
+        Загрузка клиентов текущего пользователя, итог выводится на той же странице
+        """
+        uploaded = form.cleaned_data["file"]
+        rows = iter_rows(uploaded, get_import_format(uploaded.name))
+        result = import_clients(self.request.user, rows)
+        if result.error:
+            # загруженные до ошибки клиенты остаются, итог выводится вместе с ошибкой
+            form.add_error("file", f"Файл прочитан не полностью: {result.error}")
+        return self.render_to_response(self.get_context_data(form=form, result=result))
+
+
 class ClientUpdateView(LoginRequiredMixin, UpdateView):
     model = Client
     form_class = ClientForm
@@ -289,7 +330,7 @@ class ClientDetailView(LoginRequiredMixin, DetailView):
     }
 
 
-class MessageListView(LoginRequiredMixin, ListView):
+class MessageListView(LoginRequiredMixin, OwnerQuerySetMixin, ListView):
     model = Message
     extra_context = {
         "title": "Здесь находятся Ваши сообщения для клиентов",
@@ -300,21 +341,6 @@ class MessageListView(LoginRequiredMixin, ListView):
         "create_object": "Создать новое сообщение",
     }
 
-    def get_context_data(self, **kwargs):
-        """
-        Права доступа на просмотр всех сообщений.
-        """
-        context_data = super().get_context_data(**kwargs)
-        user = self.request.user
-        if user.is_superuser:
-            return context_data
-        else:
-            object_list = list(
-                filter(lambda x: (x.owner == user), Message.objects.all())
-            )
-            context_data["object_list"] = object_list
-            return context_data
-
 
 class MessageCreateView(LoginRequiredMixin, CreateView):
     model = Message
@@ -410,20 +436,8 @@ def homepage(request):
     """
     Главная страница
     """
-    # количество сообщений
-    count_mailings = Newsletter.objects.count()
-    # количество активных сообщений
-    count_mailings_is_active = len(Newsletter.objects.filter(is_active=True))
-    # количество уникальных клиентов
-    unique_clients = (
-        Client.objects.all().values_list("email", flat=True).distinct().count()
-    )
-    # print(unique_clients)
     # три статьи для главной страницы
-    random_blog_list = list(get_blog_from_cache())
-    random.shuffle(random_blog_list)
-    blog_list = random_blog_list[:3]
-    # print(blog_list)
+    blog_list = get_random_blogs(3)
     context = {
         "title": "Вы попали на сайт создания рассылок",
         "text": "Вам требуется: во-первых, зарегистрироваться на сайте; "
@@ -432,9 +446,7 @@ def homepage(request):
         "клиентам или даже всем... В итоге можете посмотреть отчет "
         "проведенных рассылок клиентам сообщений...",
         "blog_list": blog_list,
-        "count_mailings": count_mailings,
-        "count_mailings_is_active": count_mailings_is_active,
-        "unique_clients": unique_clients,
+        **get_homepage_stats(),
     }
     return render(request, "email_newsletter/homepage.html", context)
 
@@ -442,12 +454,30 @@ def homepage(request):
 @login_required
 def get_mailing_report(request):
     """
-    Отчет проведенных рассылок
+    Отчет проведенных рассылок (постранично, с фильтром по датам)
     """
-    user = request.user
-    clients = Client.objects.all()
-    newsletters = list(filter(lambda x: (x.owner == user), Newsletter.objects.all()))
-    attempts = Attempt.objects.all().order_by("last_data")
+    form = MailingReportFilterForm(request.GET or None)
+    filters = form.cleaned_data if form.is_valid() else {}
+    deliveries = get_report_deliveries(
+        request.user, filters.get("date_from"), filters.get("date_to")
+    )
+    summary = get_newsletter_summary(
+        request.user, filters.get("date_from"), filters.get("date_to")
+    )
+    # страницы по ключу (keyset): без OFFSET и подсчета всех отправок пользователя
+    deliveries, previous_pk, next_pk = get_report_page(
+        deliveries, filters.get("after"), filters.get("before")
+    )
+    # попытки, записанные до журнала отправок клиентам, - на первой странице
+    attempts = []
+    if not (filters.get("after") or filters.get("before")):
+        attempts = get_report_attempts(
+            request.user, filters.get("date_from"), filters.get("date_to")
+        )
+    # параметры фильтра для ссылок на другие страницы
+    query = request.GET.copy()
+    for key in ("page", "after", "before"):
+        query.pop(key, None)
     context = {
         "title": "Отчет проведенных рассылок",
         "text": "Отчет доставки отразит успешность отправки и доставки сообщений клиентам. "
@@ -455,8 +485,43 @@ def get_mailing_report(request):
         "с установлением причины, "
         "а также оценить количество сообщений и процент успешно доставленных",
         "create_object": "Вернуться на главную",
-        "clients": clients,
-        "newsletters": newsletters,
+        "form": form,
+        "summary": summary,
+        "deliveries": deliveries,
         "attempts": attempts,
+        "attempts_limit": REPORT_ATTEMPTS_LIMIT,
+        "previous_pk": previous_pk,
+        "next_pk": next_pk,
+        "query": query.urlencode(),
     }
     return render(request, "email_newsletter/mailing_report.html", context)
+
+
+@login_required
+def export_mailing_report(request, export_format):
+    """
+    Выгрузка отчета отправок в CSV/JSONL потоком (фильтр по датам - как у отчета)
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise Http404
+    form = MailingReportFilterForm(request.GET or None)
+    filters = form.cleaned_data if form.is_valid() else {}
+    rows = iter_report_rows(request.user, filters.get("date_from"), filters.get("date_to"))
+    if export_format == "csv":
+        content = iter_report_csv(rows)
+    else:
+        content = iter_report_jsonl(rows)
+    response = StreamingHttpResponse(content, content_type=EXPORT_FORMATS[export_format])
+    response["Content-Disposition"] = f'attachment; filename="mailing_report.{export_format}"'
+    return response
+
+
+@staff_member_required
+def request_stats(request):
+    """
+    Накопленные метрики запросов процесса по именам маршрутов (для персонала)
+    """
+    return JsonResponse({
+        "started": registry.started,
+        "urls": registry.snapshot(),
+    }, json_dumps_params={"ensure_ascii": False, "indent": 2})
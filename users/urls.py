@@ -1,5 +1,5 @@
-from django.contrib.auth.views import LoginView, LogoutView
-from django.urls import path
+from django.contrib.auth.views import LoginView, LogoutView, PasswordResetConfirmView
+from django.urls import path, reverse_lazy
 
 from users.apps import UsersConfig
 from users.views import RegisterView, ProfileView, email_verification, password_recovery, UserListView, UserProfileModeratorView
@@ -13,6 +13,10 @@ urlpatterns = [
     path('profile/', ProfileView.as_view(), name='profile'),
     path('email-confirm/<str:token>/', email_verification, name='email-confirm'),
     path('password_recovery/', password_recovery, name='password_recovery'),
+    path('password_reset/<uidb64>/<token>/',
+         PasswordResetConfirmView.as_view(template_name='users/password_reset_confirm.html',
+                                          success_url=reverse_lazy('users:login')),
+         name='password_reset'),
     path('users/', UserListView.as_view(), name='users'),
     path('user_activation/<int:pk>', UserProfileModeratorView.as_view(template_name='users/user_activation.html'),
          name='user_activation'),
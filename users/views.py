@@ -1,17 +1,17 @@
 import secrets
 
-from django.contrib.auth.hashers import make_password
+from django.contrib.auth.tokens import default_token_generator
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.exceptions import PermissionDenied
-from django.core.mail import send_mail
 from django.http import HttpResponseRedirect
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse_lazy, reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
 from django.views.generic import CreateView, UpdateView, ListView
 
-from config.settings import EMAIL_HOST_USER
+from email_newsletter.outbox import enqueue_mail
 from users.forms import UserRegisterForm, UserProfileForm, UserProfileModeratorForm, UserModeratorForm
-from users.func import make_random_password
 
 from users.models import User
 
@@ -37,12 +37,12 @@ class RegisterView(CreateView):
         host = self.request.get_host()
         url = f"http://{host}/users/email-confirm/{token}/"
         # print(url)
-        send_mail(
+        # письмо отправится из очереди, не задерживая ответ
+        enqueue_mail(
             subject='подтверждение почты на нашем сайте',
             message=f'Привет!\n Прейдите по ссылке в подтверждение своей почты \n '
                     f'{url}',
-            from_email=EMAIL_HOST_USER,
-            recipient_list=[user.email]
+            recipient=user.email,
         )
         return super().form_valid(form)
 
@@ -67,17 +67,16 @@ def password_recovery(request):
 
         if User.objects.filter(email=email):
             user = User.objects.get(email=email)
-            new_password = make_random_password()
-            user.password = make_password(password=new_password, salt=None, hasher='default')
-            # user.set_password(new_password)
-            user.save()
-            # print(user.password)
-            send_mail(
+            # в письме - одноразовая ссылка для смены пароля, а не сам пароль:
+            # текст письма хранится в очереди до отправки
+            uid = urlsafe_base64_encode(force_bytes(user.pk))
+            token = default_token_generator.make_token(user)
+            url = request.build_absolute_uri(reverse('users:password_reset', args=[uid, token]))
+            enqueue_mail(
                 subject='Восстановление пароля',
-                message=f'Привет! новый пароль для входа на сайт: \n'
-                        f'{new_password}',
-                from_email=EMAIL_HOST_USER,
-                recipient_list=[user.email]
+                message=f'Привет! Задайте новый пароль для входа на сайт по ссылке: \n'
+                        f'{url}',
+                recipient=user.email,
             )
             return HttpResponseRedirect(reverse_lazy('users:login'))
 